@@ -1,10 +1,14 @@
+import asyncio
 import azure.functions as func
 import logging
 import json
-from utils.responseHandler import handle_request
+from functools import partial
+from utils.combinationStore import json_default
+from utils.requestMetrics import server_timing
+from utils.responseHandler import handle_request_async
 
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
 
     try:
@@ -16,15 +20,24 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
-    response = handle_request(req_body)
+    response = await handle_request_async(req_body)
 
     if isinstance(response, tuple):
-        return func.HttpResponse(
-            json.dumps(response[0]),
-            status_code=response[1],
-            mimetype="application/json",
-        )
+        body, status_code = response
+    else:
+        body, status_code = response, 200
 
+    headers = {}
+    if isinstance(body, dict) and "_metrics" in body:
+        headers["Server-Timing"] = server_timing(body["_metrics"])
+
+    # Large responses take noticeable CPU to serialize; keep the loop free meanwhile.
+    payload = await asyncio.get_running_loop().run_in_executor(
+        None, partial(json.dumps, body, default=json_default)
+    )
     return func.HttpResponse(
-        json.dumps(response), status_code=200, mimetype="application/json"
+        payload,
+        status_code=status_code,
+        headers=headers,
+        mimetype="application/json",
     )
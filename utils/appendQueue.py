@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class CoalescingQueue:
+    """
+    Merges concurrent submissions for the same key into one commit.
+    The first submitter of a key becomes the leader: it waits window seconds
+    (or for the previous commit of the key to finish), takes every submission
+    that arrived meanwhile and runs commit(key, items) once for all of them.
+    Commits of one key never overlap; other submitters block until the
+    commit holding their item returns. commit returns one result per item,
+    in order; an exception in that list is raised to its own submitter only,
+    while an exception raised by commit itself is raised to all of them.
+    """
+
+    def __init__(self, commit, window):
+        self._commit = commit
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._commit_locks = {}
+
+    def submit(self, key, item):
+        future = Future()
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = []
+                commit_lock = self._commit_locks.setdefault(key, threading.Lock())
+            batch.append((item, future))
+        if leader:
+            with commit_lock:
+                if self.window > 0:
+                    time.sleep(self.window)
+                with self._lock:
+                    entries = self._pending.pop(key)
+                self._run(key, entries)
+        return future.result()
+
+    def _run(self, key, entries):
+        try:
+            results = self._commit(key, [item for item, _ in entries])
+        except BaseException as e:
+            for _, future in entries:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(entries, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,77 @@
+# Request keys that describe the batch itself and are not passed to its operations.
+BATCH_KEYS = ("functionName", "operations", "metrics")
+
+# Runs of a batch whose conditional writes (e.g. AddCombin manifests) found the
+# blobs changed by another writer before anything was written.
+BATCH_MAX_ATTEMPTS = 3
+
+
+def handle_batch(data, handle_operation):
+    """
+    Runs an ordered list of operations against one storage session, so every
+    model they reference is downloaded and parsed at most once and every blob
+    they write is uploaded once, after the last operation.
+    Every other top-level key of the request is a default for the operations.
+    The batch stops at the first failing operation (the rest are reported as
+    skipped); the writes of the operations that ran are still uploaded.
+    Blobs written conditionally (manifests of appended models) are checked
+    before the writes start; when another writer changed one, the whole batch
+    runs again, up to BATCH_MAX_ATTEMPTS times, and then fails with 409.
+    Args:
+        data (dict): The request body, with "operations" as a list of request bodies.
+        handle_operation (Callable[[dict], tuple]): Runs one request body and
+            returns (response, status code).
+    Returns:
+        tuple: ({"results", "downloads", "writes", "attempts"}, status code of
+        the first failing operation, or 200).
+    """
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return {"error": "operations must be a non-empty list."}, 400
+    defaults = {k: v for k, v in data.items() if k not in BATCH_KEYS}
+
+    from utils import blobHandler
+    from utils.blobSession import SessionConflictError
+
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        results = []
+        status = 200
+        try:
+            with blobHandler.batch_session() as session:
+                for operation in operations:
+                    result, code = _run_operation(
+                        operation, defaults, handle_operation, status
+                    )
+                    results.append(result)
+                    if code >= 400:
+                        status = code
+        except SessionConflictError as e:
+            # Nothing reached the container, so the batch can run again on
+            # the new state of the blobs it read.
+            if not e.written and attempt + 1 < BATCH_MAX_ATTEMPTS:
+                continue
+            return {
+                "error": f"{e} The batch was not fully written; retry it.",
+                "partially_written": e.written,
+                "results": results,
+            }, 409
+        except Exception as e:
+            return {"error writing batch results": str(e), "results": results}, 500
+        return {
+            "results": results,
+            "downloads": session.downloads,
+            "writes": session.written,
+            "attempts": attempt + 1,
+        }, status
+
+
+def _run_operation(operation, defaults, handle_operation, status):
+    """Runs one operation unless an earlier one failed; returns (result entry, code)."""
+    name = operation.get("functionName") if isinstance(operation, dict) else None
+    if status != 200:
+        return {"functionName": name, "status": "skipped"}, status
+    if name is None or name == "Batch":
+        response, code = {"error": "Invalid operation."}, 400
+    else:
+        response, code = handle_operation({**defaults, **operation})
+    return {"functionName": name, "status": code, "result": response}, code
@@ -1,54 +1,630 @@
 import os
 import json
-from azure.storage.blob import BlobServiceClient
+import base64
+import gzip
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+import logging
+import random
+import threading
+import time
+import uuid
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+from utils.appendQueue import CoalescingQueue
 from utils.combinGenerator import (
     generate_all_combinations,
     generate_random_combinations,
+    iter_all_combinations,
+    full_model_cache_key,
+)
+from utils.combinPropertiesFunctions import (
+    filter_keys,
+    normalize_windows,
+    refresh_windowed_analytics,
+)
+from utils.incrementalAnalytics import (
+    analytics_from_state,
+    new_analytics_state,
+    recent_rows,
+    state_matches,
+    update_analytics_state,
+)
+from utils.requestMetrics import record, stage
+from utils.blobSession import current_session, session_scope
+from utils.combinationStore import CombinationStore, json_default
+from utils.columnarModel import ColumnarModel, ColumnarWriter, encode_model
+from utils.modelCache import ModelCache, estimate_rows_size
+from utils.shardedGenerator import (
+    DEFAULT_SHARD_ROWS,
+    iter_shard_models,
+    run_sharded,
 )
-from utils.combinPropertiesFunctions import refresh_analytics
 
 # Get the connection string from the environment variable
+logger = logging.getLogger(__name__)
+
 BLOB_CONNECTION_STRING = os.getenv("BLOB_CONNECTION_STRING")
 BLOB_CONTAINER_NAME = os.getenv("BLOB_CONTAINER_NAME", "default-container")
 
-# Check if the connection string  and container name are set
-if not BLOB_CONNECTION_STRING:
-    raise ValueError("BLOB_CONNECTION_STRING environment variable is not set.")
+# Connections kept alive by the shared client; concurrent requests and the
+# block staging of upload_stream all draw from this pool.
+BLOB_POOL_SIZE = int(os.getenv("BLOB_POOL_SIZE", 32))
+
+
+def _pooled_transport(pool_size=BLOB_POOL_SIZE):
+    """HTTP transport whose session keeps up to pool_size connections alive."""
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
+# The container client is created on first use (see get_container_client), so
+# importing this module neither loads the storage SDK nor needs storage config.
+container_client = None
+_client_lock = threading.Lock()
+
+
+def get_container_client():
+    """
+    Returns the shared container client, creating it on first use. The client
+    is thread-safe and reused by every request.
+    Raises:
+        ValueError: If the storage connection string or container name is not set.
+    """
+    global container_client
+    if container_client is None:
+        with _client_lock:
+            if container_client is None:
+                # Check if the connection string  and container name are set
+                if not BLOB_CONNECTION_STRING:
+                    raise ValueError(
+                        "BLOB_CONNECTION_STRING environment variable is not set."
+                    )
+                if not BLOB_CONTAINER_NAME:
+                    raise ValueError(
+                        "BLOB_CONTAINER_NAME environment variable is not set."
+                    )
+                from azure.storage.blob import BlobServiceClient
+
+                blob_service_client = BlobServiceClient.from_connection_string(
+                    BLOB_CONNECTION_STRING, transport=_pooled_transport()
+                )
+                container_client = blob_service_client.get_container_client(
+                    BLOB_CONTAINER_NAME
+                )
+    session = current_session()
+    if session is not None:
+        return session.wrap(container_client)
+    return container_client
+
 
-if not BLOB_CONTAINER_NAME:
-    raise ValueError("BLOB_CONTAINER_NAME environment variable is not set.")
+@contextmanager
+def batch_session():
+    """
+    Runs the enclosed storage calls against a BlobSession: each blob is
+    downloaded and each row list parsed at most once, and every blob written
+    is uploaded once, when the block exits without raising.
+    """
+    with session_scope() as session:
+        yield session
+    session.flush(get_container_client(), UPLOAD_MAX_CONCURRENCY)
+
+
+# Size of each block staged by upload_stream (Azure allows up to 4000 MiB per block).
+UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Blocks staged concurrently by upload_stream.
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("BLOB_UPLOAD_CONCURRENCY", 4))
+
+# Gzip JSON uploads (Content-Encoding: gzip) unless a request says otherwise.
+UPLOAD_GZIP = os.getenv("BLOB_UPLOAD_GZIP", "false").lower() == "true"
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Extension of the columnar binary copy stored next to each JSON model.
+COLUMNAR_EXTENSION = ".rmc"
+
+# Parsed models (row lists and columnar copies) of recent reads, keyed by blob
+# path and revalidated against the blob ETag with a conditional GET.
+model_read_cache = ModelCache(
+    int(os.getenv("MODEL_READ_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+)
 
-# Initialize the BlobServiceClient
-blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONNECTION_STRING)
-container_client = blob_service_client.get_container_client(BLOB_CONTAINER_NAME)
+# Concurrent appends to a model arriving within this window are committed
+# together; conflicting manifest writes are retried with jittered backoff.
+APPEND_COALESCE_WINDOW = int(os.getenv("APPEND_COALESCE_MS", 20)) / 1000
+APPEND_MAX_ATTEMPTS = int(os.getenv("APPEND_MAX_ATTEMPTS", 8))
+APPEND_RETRY_DELAY = 0.05
+
+# Metadata key of the export blob of an actual model holding its row count.
+EXPORT_ROWS_KEY = "rows"
+
+# Appends are written as segments; past this many segments they are compacted.
+COMPACTION_SEGMENT_LIMIT = 16
 
 
 # function to resolve data from request body.
 def resolve_data_from_request(
-    data=None, population=None, size=None, amount=None, full_model=False, start_index=1
+    data=None,
+    population=None,
+    size=None,
+    amount=None,
+    full_model=False,
+    start_index=1,
+    properties=None,
 ):
     if data:
         return data
     if population and size:
         if full_model:
-            return generate_all_combinations(population, size)
+            return generate_all_combinations(population, size, properties)
         elif amount:
-            return generate_random_combinations(population, size, amount, start_index)
+            return generate_random_combinations(
+                population, size, amount, start_index, properties
+            )
 
     raise ValueError("Insufficient parameters provided to resolve data.")
 
 
+def serialize_json_chunks(chunks, continued=False):
+    """
+    Serializes chunks of models as one JSON array, fragment by fragment.
+    The concatenated output is identical to json.dumps(all_rows, indent=2),
+    but only one row is ever rendered as a string at a time.
+    With continued, the rows extend an array whose opening rows were already
+    written: the first one is preceded by a comma instead of the bracket.
+    """
+    first = not continued
+    for chunk in chunks:
+        started = time.perf_counter()
+        elapsed = 0.0
+        for row in chunk:
+            prefix = "[\n  " if first else ",\n  "
+            first = False
+            row_json = json.dumps(row, indent=2, default=json_default)
+            fragment = prefix + row_json.replace("\n", "\n  ")
+            elapsed += time.perf_counter() - started
+            yield fragment
+            started = time.perf_counter()
+        record("serialization", rows=len(chunk), seconds=elapsed)
+    yield "[]" if first else "\n]"
+
+
+def upload_stream(
+    blob_client,
+    fragments,
+    block_size=UPLOAD_BLOCK_SIZE,
+    metadata=None,
+    compress=None,
+    max_concurrency=UPLOAD_MAX_CONCURRENCY,
+    tail_block=False,
+    **conditions,
+):
+    """
+    Uploads an iterable of string fragments as a block blob. Fragments are
+    encoded (and gzipped when compress is set, with Content-Encoding: gzip)
+    into fixed-size blocks that are staged concurrently; at most
+    max_concurrency blocks are in flight, so memory stays bounded and the
+    payload never exists as one string. Payloads that fit in a single block
+    are uploaded with a plain upload_blob call.
+    tail_block stages the last fragment as a block of its own, even for small
+    uncompressed payloads, so the blob can later be extended in place of it.
+    conditions (etag, match_condition) apply to the final write.
+    """
+    from azure.storage.blob import BlobBlock, ContentSettings
+
+    model_read_cache.pop(blob_client.blob_name)
+    compress = UPLOAD_GZIP if compress is None else compress
+    tail_block = tail_block and not compress
+    content_settings = ContentSettings(
+        content_type="application/json",
+        content_encoding="gzip" if compress else None,
+    )
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    block_ids = []
+    in_flight = deque()
+    # unique per upload, so concurrent writers to the blob never stage over
+    # each other's uncommitted blocks
+    block_prefix = _block_prefix()
+    # bytes sent and time spent blocked on the service, for the request metrics
+    sent = 0
+    blocked = 0.0
+
+    def wait(started):
+        nonlocal blocked
+        blocked += time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+
+        def stage_block(payload):
+            nonlocal sent
+            block_id = _block_id(block_prefix, len(block_ids))
+            block_ids.append(block_id)
+            in_flight.append(pool.submit(blob_client.stage_block, block_id, payload))
+            sent += len(payload)
+            started = time.perf_counter()
+            while len(in_flight) >= max_concurrency:
+                in_flight.popleft().result()
+            wait(started)
+
+        def drain(final=False):
+            while len(buffer) >= block_size or (final and buffer):
+                stage_block(bytes(buffer[:block_size]))
+                del buffer[:block_size]
+
+        tail = None
+        for fragment in fragments:
+            if tail_block:
+                fragment, tail = tail, fragment
+                if fragment is None:
+                    continue
+            data = fragment.encode("utf-8")
+            buffer.extend(compressor.compress(data) if compressor else data)
+            drain()
+        if compressor:
+            buffer.extend(compressor.flush())
+
+        started = time.perf_counter()
+        if not tail_block and not block_ids and len(buffer) <= block_size:
+            blob_client.upload_blob(
+                bytes(buffer),
+                overwrite=True,
+                metadata=metadata,
+                content_settings=content_settings,
+                **conditions,
+            )
+            wait(started)
+            record("blob_upload", bytes=len(buffer), seconds=blocked)
+            return
+        drain(final=True)
+        if tail is not None:
+            stage_block(tail.encode("utf-8"))
+        started = time.perf_counter()
+        while in_flight:
+            in_flight.popleft().result()
+        wait(started)
+
+    started = time.perf_counter()
+    blob_client.commit_block_list(
+        [BlobBlock(block_id=b) for b in block_ids],
+        metadata=metadata,
+        content_settings=content_settings,
+        **conditions,
+    )
+    wait(started)
+    record("blob_upload", bytes=sent, seconds=blocked)
+
+
+def json_fragments(value):
+    """Fragments of json.dumps(value, indent=2), rendered row by row for lists."""
+    if isinstance(value, (list, CombinationStore)):
+        return serialize_json_chunks([value])
+    return [json.dumps(value, indent=2)]
+
+
+def upload_json(blob_client, value, metadata=None, compress=None):
+    """Uploads a JSON document through upload_stream."""
+    upload_stream(
+        blob_client, json_fragments(value), metadata=metadata, compress=compress
+    )
+
+
+def upload_bytes(blob_client, data, **kwargs):
+    """Uploads a small or binary payload in one call, overwriting the blob."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    model_read_cache.pop(blob_client.blob_name)
+    with stage("blob_upload"):
+        blob_client.upload_blob(data, overwrite=True, **kwargs)
+    record("blob_upload", bytes=len(data))
+
+
+def _inflate(data):
+    record("blob_download", bytes=len(data))
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    return data
+
+
+def read_blob_bytes(blob_client):
+    """Downloads a blob, transparently inflating gzip-encoded content."""
+    with stage("blob_download"):
+        data = blob_client.download_blob().readall()
+    return _inflate(data)
+
+
+def read_cached(blob_client, parse=json.loads, sizeof=estimate_rows_size):
+    """
+    Downloads and parses a blob through model_read_cache. A cached copy is
+    revalidated with a conditional GET on its ETag, so an unchanged blob is
+    neither downloaded nor parsed again. The parsed value is shared with
+    later readers and must not be mutated.
+    Args:
+        parse (Callable[[bytes], Any]): Builds the value from the blob content.
+        sizeof (Callable[[Any], int]): Size estimate of the value for the cache budget.
+    """
+    path = blob_client.blob_name
+    cached = model_read_cache.get(path)
+    conditions = {}
+    if cached is not None:
+        conditions = {"etag": cached[0], "match_condition": MatchConditions.IfModified}
+    try:
+        with stage("blob_download"):
+            downloader = blob_client.download_blob(**conditions)
+            data = downloader.readall()
+    except ResourceNotFoundError:
+        model_read_cache.pop(path)
+        raise
+    except HttpResponseError as e:
+        # The storage SDK surfaces the 304 as a plain HttpResponseError.
+        if cached is None or e.status_code != 304:
+            raise
+        record("model_cache_hit", rows=1)
+        return cached[1]
+    value = parse(_inflate(data))
+    etag = downloader.properties.etag
+    if etag is not None:
+        model_read_cache.put(path, (etag, value), size=sizeof(value))
+    return value
+
+
+def read_json(blob_client):
+    """Downloads and parses a JSON blob written by upload_json or upload_blob."""
+    session = current_session()
+    if session is not None:
+        return session.read_json(
+            blob_client.blob_name, lambda: json.loads(read_blob_bytes(blob_client))
+        )
+    return json.loads(read_blob_bytes(blob_client))
+
+
+def _columnar_blob_client(model_type, model_name):
+    return get_container_client().get_blob_client(
+        f"{model_type}/{model_name}{COLUMNAR_EXTENSION}"
+    )
+
+
+def _keep_columnar(blob_client, binary_format):
+    """The columnar copy is written when requested, or refreshed if one already exists."""
+    return binary_format or blob_client.exists()
+
+
+def _gzipped(compress):
+    """Whether upload_stream gzips a payload for the given compress argument."""
+    return UPLOAD_GZIP if compress is None else bool(compress)
+
+
+def _has_cache_key(blob_client, cache_key, gzipped=None):
+    """
+    True when the blob exists and was written for the given content key and,
+    unless gzipped is None, with the requested content encoding.
+    """
+    try:
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return False
+    if gzipped is not None:
+        encoding = getattr(properties.content_settings, "content_encoding", None)
+        if (encoding == "gzip") != gzipped:
+            return False
+    return (properties.metadata or {}).get("cache_key") == cache_key
+
+
+def _tee_to_writer(chunks, writer):
+    for chunk in chunks:
+        writer.append(chunk)
+        yield chunk
+
+
+def load_columnar_model(model_type, model_name):
+    """Downloads the columnar copy of a model, or returns None if there is none."""
+    blob_client = _columnar_blob_client(model_type, model_name)
+    try:
+        return read_cached(blob_client, ColumnarModel, sizeof=lambda m: m.nbytes)
+    except ResourceNotFoundError:
+        return None
+
+
+def _upload_model_part(
+    prefix,
+    binary_format,
+    metadata,
+    compress,
+    properties,
+    number,
+    population,
+    size,
+    start_rank,
+    row_count,
+):
+    """Process-pool worker: generates one shard and streams it to its part blob."""
+    path = f"{prefix}/part_{number:05d}.json"
+    chunks = iter_shard_models(
+        population, size, start_rank, row_count, properties=properties
+    )
+    writer = ColumnarWriter(population) if binary_format else None
+    if writer:
+        chunks = _tee_to_writer(chunks, writer)
+    upload_stream(
+        get_container_client().get_blob_client(path),
+        serialize_json_chunks(chunks),
+        metadata=metadata,
+        compress=compress,
+    )
+    part = {"path": path, "start_index": start_rank + 1, "rows": row_count}
+    if writer:
+        part["columnar_path"] = f"{prefix}/part_{number:05d}{COLUMNAR_EXTENSION}"
+        upload_bytes(
+            get_container_client().get_blob_client(part["columnar_path"]),
+            writer.to_bytes(),
+            metadata=metadata,
+        )
+    return part
+
+
+def upload_sharded_model(
+    model_type,
+    model_name,
+    population,
+    size,
+    workers=None,
+    binary_format=False,
+    shard_rows=DEFAULT_SHARD_ROWS,
+    compress=None,
+    properties=None,
+):
+    """
+    Builds a full model in parallel: the C(n,k) rank space is split into
+    contiguous shards, each generated and uploaded by a worker process as
+    {model_type}/{model_name}/part_NNNNN.json, with a manifest listing the
+    parts, their global start index and row counts.
+    """
+    prefix = f"{model_type}/{model_name}"
+    cache_key = full_model_cache_key(population, size, properties)
+    manifest_client = get_container_client().get_blob_client(f"{prefix}/manifest.json")
+    try:
+        manifest = read_json(manifest_client)
+    except ResourceNotFoundError:
+        manifest = None
+    if (
+        manifest
+        and manifest["cache_key"] == cache_key
+        and manifest.get("gzipped", False) == _gzipped(compress)
+        and (not binary_format or all("columnar_path" in p for p in manifest["parts"]))
+    ):
+        return {
+            "status": "success",
+            "message": f"Model {model_name} of type {model_type} is already up to date at {prefix}.",
+            "cached": True,
+        }
+
+    worker = partial(
+        _upload_model_part,
+        prefix,
+        binary_format,
+        {"cache_key": cache_key},
+        compress,
+        properties,
+    )
+    parts = run_sharded(worker, population, size, workers, shard_rows)
+    manifest = {
+        "population": population,
+        "size": size,
+        "row_count": sum(part["rows"] for part in parts),
+        "cache_key": cache_key,
+        "gzipped": _gzipped(compress),
+        "parts": parts,
+    }
+    upload_bytes(manifest_client, json.dumps(manifest, indent=2))
+    return {
+        "status": "success",
+        "message": f"Model {model_name} of type {model_type} uploaded in {len(parts)} parts to {prefix}.",
+        "parts": len(parts),
+        "combinations_count": manifest["row_count"],
+    }
+
+
 def upload_model(
-    model_type, model_name, data=None, population=None, amount=None, size=None
+    model_type,
+    model_name,
+    data=None,
+    population=None,
+    amount=None,
+    size=None,
+    binary_format=False,
+    workers=None,
+    compress=None,
+    properties=None,
 ):
     model_type = model_type or "fullModels"
     model_name = model_name or f"fullModel_{population}_{size}"
-    resolved_data = resolve_data_from_request(
-        data, population, size, amount, full_model=(model_type.startswith("fullModel"))
-    )
+    full_model = model_type.startswith("fullModel")
+    if full_model and workers and not data and population and size:
+        return upload_sharded_model(
+            model_type,
+            model_name,
+            population,
+            size,
+            workers,
+            binary_format,
+            compress=compress,
+            properties=properties,
+        )
     path = f"{model_type}/{model_name}.json"
-    blob_client = container_client.get_blob_client(path)
-    blob_client.upload_blob(json.dumps(resolved_data, indent=2), overwrite=True)
+    blob_client = get_container_client().get_blob_client(path)
+    columnar_client = _columnar_blob_client(model_type, model_name)
+    keep_columnar = _keep_columnar(columnar_client, binary_format)
+
+    if full_model and not data and population and size:
+        # Full models are fully determined by their content key; skip both
+        # generation and upload when the stored blobs already carry it.
+        cache_key = full_model_cache_key(population, size, properties)
+        metadata = {"cache_key": cache_key}
+        if _has_cache_key(blob_client, cache_key, _gzipped(compress)) and (
+            not keep_columnar or _has_cache_key(columnar_client, cache_key)
+        ):
+            return {
+                "status": "success",
+                "message": f"Model {model_name} of type {model_type} is already up to date at {path}.",
+                "cached": True,
+            }
+
+        # Full models are streamed so the whole universe is never held in memory.
+        chunks = iter_all_combinations(population, size, properties=properties)
+        writer = ColumnarWriter(population) if keep_columnar else None
+        if writer:
+            chunks = _tee_to_writer(chunks, writer)
+        upload_stream(
+            blob_client,
+            serialize_json_chunks(chunks),
+            metadata=metadata,
+            compress=compress,
+        )
+        if writer:
+            upload_bytes(columnar_client, writer.to_bytes(), metadata=metadata)
+    else:
+        resolved_data = resolve_data_from_request(
+            data,
+            population,
+            size,
+            amount,
+            full_model=full_model,
+            properties=properties,
+        )
+        columnar = encode_model(resolved_data, population) if keep_columnar else None
+        if model_type == "actualModels" and isinstance(
+            resolved_data, (list, CombinationStore)
+        ):
+            upload_export(blob_client, resolved_data)
+        else:
+            upload_json(blob_client, resolved_data, compress=compress)
+        if columnar:
+            upload_bytes(columnar_client, columnar)
+        if model_type == "actualModels":
+            # The new blob replaces every appended segment and invalidates analytics.
+            rows = (
+                len(resolved_data)
+                if isinstance(resolved_data, (list, CombinationStore))
+                else 1
+            )
+            _reset_segments(model_name, rows, bool(columnar), population)
+            _delete_analytics_state(model_name)
     return {
         "status": "success",
         "message": f"Model {model_name} of type {model_type} uploaded successfully to {path}.",
@@ -56,81 +632,749 @@ def upload_model(
 
 
 def overwrite_model(
-    model_type, model_name, data=None, population=None, amount=None, size=None
+    model_type,
+    model_name,
+    data=None,
+    population=None,
+    amount=None,
+    size=None,
+    binary_format=False,
+    workers=None,
+    compress=None,
+    properties=None,
 ):
-    return upload_model(model_type, model_name, data, population, amount, size)
+    return upload_model(
+        model_type,
+        model_name,
+        data,
+        population,
+        amount,
+        size,
+        binary_format,
+        workers,
+        compress,
+        properties,
+    )
 
 
-def append_to_model(model_name, data=None, population=None, size=None, amount=None):
+def _segments_prefix(model_name):
+    return f"actualModels/{model_name}_segments"
 
-    if not model_name:
-        raise ValueError("Model name must be provided.")
 
-    # Retrieve existing data from the blob
-    path = f"actualModels/{model_name}.json"
-    blob_client = container_client.get_blob_client(path)
+def _base_path(model_name):
+    return f"actualModels/{model_name}.json"
+
+
+def _manifest_blob_client(model_name):
+    return get_container_client().get_blob_client(
+        f"{_segments_prefix(model_name)}/manifest.json"
+    )
+
 
+def _export_blob_client(model_name):
+    return get_container_client().get_blob_client(_base_path(model_name))
+
+
+def _write_conflict(error):
+    """True when a conditional write lost to a concurrent writer."""
+    return (
+        isinstance(error, (ResourceModifiedError, ResourceExistsError))
+        or getattr(error, "error_code", None) == "InvalidBlockList"
+    )
+
+
+def _conditions(etag):
+    """Write conditions matching a blob read at etag, or a blob still missing."""
+    return {
+        "etag": etag,
+        "match_condition": (
+            MatchConditions.IfNotModified if etag else MatchConditions.IfMissing
+        ),
+    }
+
+
+def upload_export(blob_client, rows, **conditions):
+    """
+    Writes the export blob of an actual model (actualModels/{model}.json, the
+    blob Power BI reads) with its row count in the metadata and its closing
+    bracket as a block of its own, so _extend_export can append to it later.
+    It is never gzipped, whatever BLOB_UPLOAD_GZIP says: a compressed export
+    could not be extended and every append would rewrite it.
+    """
+    upload_stream(
+        blob_client,
+        serialize_json_chunks([rows]),
+        metadata={EXPORT_ROWS_KEY: str(len(rows))},
+        compress=False,
+        tail_block=True,
+        **conditions,
+    )
+
+
+def _export_state(blob_client):
+    """(rows, etag, gzipped) of an export blob; rows is None when missing or unknown."""
     try:
-        existing_data = json.loads(blob_client.download_blob().readall())
-    except Exception as e:
-        existing_data = []
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return None, None, False
+    rows = (properties.metadata or {}).get(EXPORT_ROWS_KEY)
+    encoding = getattr(properties.content_settings, "content_encoding", None)
+    return (
+        int(rows) if rows is not None else None,
+        getattr(properties, "etag", None),
+        encoding == "gzip",
+    )
 
-    start_index = len(existing_data) + 1 if existing_data else 1
 
-    resolved_data = resolve_data_from_request(
-        data, population, size, amount, start_index=start_index
+def _block_prefix():
+    """A random prefix shared by the block ids of one upload."""
+    return uuid.uuid4().hex[:8]
+
+
+def _block_id(prefix, index):
+    """
+    The id of the index-th block staged by an upload. Every id has the same
+    length, as the service requires of the blocks of a blob.
+    """
+    return base64.b64encode(f"{prefix}{index:08d}".encode()).decode()
+
+
+def _extend_export(blob_client, rows, rows_before, **conditions):
+    """
+    Appends rows to an export blob written by upload_export: its closing
+    block is replaced by blocks holding the rows and a new closing block.
+    Returns False when the blob does not end with a closing block of its own.
+    """
+    from azure.storage.blob import BlobBlock, BlockState, ContentSettings
+
+    committed, _ = blob_client.get_block_list("committed")
+    fragments = list(serialize_json_chunks([rows], continued=True))
+    tail = fragments.pop().encode("utf-8")
+    block_prefix = _block_prefix()
+    if (
+        not committed
+        or committed[-1].size != len(tail)
+        or len(committed[-1].id) != len(_block_id(block_prefix, 0))
+    ):
+        # blobs staged with shorter ids before block ids were prefixed are rewritten
+        return False
+    body = "".join(fragments).encode("utf-8")
+    payloads = [
+        body[start : start + UPLOAD_BLOCK_SIZE]
+        for start in range(0, len(body), UPLOAD_BLOCK_SIZE)
+    ]
+    block_list = [
+        BlobBlock(block_id=block.id, state=BlockState.COMMITTED)
+        for block in committed[:-1]
+    ]
+    with stage("blob_upload"):
+        for index, payload in enumerate(payloads + [tail]):
+            block_id = _block_id(block_prefix, index)
+            blob_client.stage_block(block_id, payload)
+            block_list.append(BlobBlock(block_id=block_id))
+        blob_client.commit_block_list(
+            block_list,
+            metadata={EXPORT_ROWS_KEY: str(rows_before + len(rows))},
+            content_settings=ContentSettings(content_type="application/json"),
+            **conditions,
+        )
+    record("blob_upload", bytes=len(body) + len(tail))
+    model_read_cache.pop(blob_client.blob_name)
+    return True
+
+
+def sync_export(model_name, manifest=None, tail_rows=None):
+    """
+    Brings the export blob of an actual model up to its manifest. The rows it
+    lacks are appended as new blocks, so the work is proportional to them;
+    gzip-encoded exports and blobs written before exports kept a row count
+    are rewritten instead, uncompressed, so later appends extend them. Writes are conditional on the blob's ETag, so
+    concurrent writers never reorder rows: the one that lost re-reads the
+    blob and only adds what is still missing.
+    Args:
+        tail_rows (list): The last rows of the model, when the caller has them.
+    """
+    manifest = manifest or load_manifest(model_name)
+    blob_client = _export_blob_client(model_name)
+    for attempt in range(APPEND_MAX_ATTEMPTS):
+        exported, etag, gzipped = _export_state(blob_client)
+        if exported is not None and exported >= manifest["row_count"]:
+            return
+        conditions = _conditions(etag)
+        try:
+            if exported and not gzipped:
+                missing = manifest["row_count"] - exported
+                if tail_rows is not None and len(tail_rows) >= missing:
+                    rows = tail_rows[len(tail_rows) - missing :]
+                else:
+                    rows = load_model_rows(
+                        model_name, manifest=manifest, first_row=exported
+                    )
+                if _extend_export(blob_client, rows, exported, **conditions):
+                    return
+            rows = load_model_rows(model_name, manifest=manifest)
+            upload_export(blob_client, rows, **conditions)
+            return
+        except HttpResponseError as e:
+            if not _write_conflict(e):
+                raise
+            time.sleep(random.uniform(0, APPEND_RETRY_DELAY * 2**attempt))
+    raise RuntimeError(
+        f"Could not update the export of model {model_name}: "
+        f"it kept changing after {APPEND_MAX_ATTEMPTS} attempts."
+    )
+
+
+def _sync_export_after_append(model_name, manifest=None, tail_rows=None):
+    """Best-effort sync_export; in a batch it runs once the batch is written."""
+    session = current_session()
+    if session is not None:
+        session.after_flush(
+            ("export", model_name), partial(_sync_export_after_append, model_name)
+        )
+        return
+    try:
+        sync_export(model_name, manifest, tail_rows)
+    except Exception:
+        # The rows are committed; the next append or compaction catches up.
+        logger.warning("Export of model %s not updated.", model_name, exc_info=True)
+
+
+def _read_manifest(model_name):
+    """
+    The manifest of an actual model and the ETag it was read at. Models
+    written before segmented storage have no manifest; their single JSON
+    blob is adopted as the base segment (a download to learn its row count)
+    and the ETag is None, as it is for models that do not exist yet.
+    """
+    client = _manifest_blob_client(model_name)
+    try:
+        with stage("blob_download"):
+            downloader = client.download_blob()
+            data = downloader.readall()
+        return json.loads(_inflate(data)), downloader.properties.etag
+    except ResourceNotFoundError:
+        pass
+
+    base_client = get_container_client().get_blob_client(_base_path(model_name))
+    try:
+        base_rows = read_json(base_client)
+    except ResourceNotFoundError:
+        return _new_manifest(model_name, 0), None
+    return _new_manifest(model_name, len(base_rows)), None
+
+
+def load_manifest(model_name):
+    """
+    Loads the segment manifest of an actual model; the manifest adopting the
+    blob of a model written before segmented storage is saved on first load.
+    """
+    manifest, etag = _read_manifest(model_name)
+    if etag is None and manifest["segments"]:
+        save_manifest(model_name, manifest)
+    return manifest
+
+
+def _new_manifest(
+    model_name, base_rows, next_segment=1, columnar=False, population=None
+):
+    segments = (
+        [{"path": _base_path(model_name), "rows": base_rows}] if base_rows else []
+    )
+    return {
+        "row_count": base_rows,
+        "next_segment": next_segment,
+        "columnar": columnar,
+        "population": population,
+        "segments": segments,
+    }
+
+
+def save_manifest(model_name, manifest, etag=None, conditional=False):
+    """
+    Writes the manifest. A conditional write only succeeds if the manifest
+    is still the one read at etag (or still missing when etag is None) and
+    raises ResourceModifiedError (ResourceExistsError when it appeared) otherwise.
+    """
+    conditions = _conditions(etag) if conditional else {}
+    upload_bytes(
+        _manifest_blob_client(model_name),
+        json.dumps(manifest, indent=2),
+        **conditions,
     )
 
-    if isinstance(resolved_data, list):
-        existing_data.extend(resolved_data)
+
+def _load_segment(model_name, segment, columns=None):
+    """Reads one segment; the base segment is served from its columnar copy when current."""
+    if segment["path"] == _base_path(model_name):
+        columnar = load_columnar_model("actualModels", model_name)
+        if (
+            columnar is not None
+            and not columnar.partial
+            and len(columnar) >= segment["rows"]
+        ):
+            return columnar.to_dicts(columns)[: segment["rows"]]
+    blob_client = get_container_client().get_blob_client(segment["path"])
+    rows = read_cached(blob_client)
+    # The base blob may already hold rows of a compaction that did not finish.
+    return rows[: segment["rows"]]
+
+
+def load_model_rows(model_name, columns=None, manifest=None, first_row=0):
+    """
+    Assembles every segment of an actual model into one list of rows.
+    Args:
+        columns (list[str]): Columns needed by the caller; lets the columnar
+            copy decode only those. JSON segments always return full rows.
+        first_row (int): Number of leading rows to skip; segments that lie
+            entirely before it are not downloaded.
+    """
+    manifest = manifest or load_manifest(model_name)
+    rows = []
+    segment_start = 0
+    for segment in manifest["segments"]:
+        segment_end = segment_start + segment["rows"]
+        if segment_end > first_row:
+            segment_rows = _load_segment(model_name, segment, columns)
+            rows.extend(segment_rows[max(first_row - segment_start, 0) :])
+        segment_start = segment_end
+    return rows
+
+
+def _reset_segments(
+    model_name, base_rows, columnar=False, population=None, expected=None
+):
+    """
+    Points the manifest at a freshly written base blob and drops old segments.
+    expected is the (manifest, etag) the base blob was built from; the manifest
+    is then only replaced if no append landed since (ResourceModifiedError).
+    """
+    if expected is None:
+        try:
+            previous = read_json(_manifest_blob_client(model_name))
+        except ResourceNotFoundError:
+            previous = None
     else:
-        existing_data.append(resolved_data)
+        previous = expected[0] if expected[0]["segments"] else None
+    next_segment = previous["next_segment"] if previous else 1
+    population = population or (previous or {}).get("population")
+    save_manifest(
+        model_name,
+        _new_manifest(model_name, base_rows, next_segment, columnar, population),
+        etag=expected[1] if expected else None,
+        conditional=expected is not None,
+    )
+    for segment in previous["segments"] if previous else []:
+        if segment["path"] != _base_path(model_name):
+            get_container_client().get_blob_client(segment["path"]).delete_blob()
 
-    # Upload the updated data back to the blob
-    blob_client.upload_blob(json.dumps(existing_data, indent=2), overwrite=True)
+
+def compact_model(model_name, binary_format=False):
+    """
+    Merges every segment of an actual model back into its base blob
+    (actualModels/{model}.json, the Power BI export) and its columnar copy.
+    The export and the manifest are only replaced if no append changed them
+    meanwhile; otherwise the compaction starts over from the new manifest.
+    When the export already holds every row, as appends keep it, the manifest
+    is just pointed at it and nothing is read or rewritten; binary_format
+    forces the full merge, which also rebuilds the columnar copy.
+    """
+    if not model_name:
+        raise ValueError("Model name must be provided.")
+
+    export_client = _export_blob_client(model_name)
+    columnar_client = _columnar_blob_client("actualModels", model_name)
+    for attempt in range(APPEND_MAX_ATTEMPTS):
+        exported, export_etag, gzipped = _export_state(export_client)
+        manifest, etag = _read_manifest(model_name)
+        row_count = manifest["row_count"]
+        if (
+            not binary_format
+            and not gzipped
+            and exported is not None
+            and exported >= row_count
+        ):
+            try:
+                # A columnar copy left behind is ignored by readers once it
+                # holds fewer rows than the base segment.
+                _reset_segments(
+                    model_name,
+                    row_count,
+                    bool(manifest.get("columnar")),
+                    manifest.get("population"),
+                    expected=(manifest, etag),
+                )
+                break
+            except HttpResponseError as e:
+                if not _write_conflict(e):
+                    raise
+                time.sleep(random.uniform(0, APPEND_RETRY_DELAY * 2**attempt))
+                continue
+
+        rows = load_model_rows(model_name, manifest=manifest)
+
+        columnar = None
+        if _keep_columnar(columnar_client, binary_format or manifest.get("columnar")):
+            columnar = encode_model(rows, manifest.get("population"))
+
+        try:
+            upload_export(export_client, rows, **_conditions(export_etag))
+            if columnar:
+                upload_bytes(columnar_client, columnar)
+            # The base blob may now hold more rows than the manifest points at,
+            # which readers ignore, so losing this race to an append is harmless.
+            _reset_segments(
+                model_name,
+                len(rows),
+                bool(columnar),
+                manifest.get("population"),
+                expected=(manifest, etag),
+            )
+            break
+        except HttpResponseError as e:
+            if not _write_conflict(e):
+                raise
+            time.sleep(random.uniform(0, APPEND_RETRY_DELAY * 2**attempt))
+    else:
+        raise RuntimeError(
+            f"Could not compact model {model_name}: "
+            f"it kept changing after {APPEND_MAX_ATTEMPTS} attempts."
+        )
 
     return {
         "status": "success",
-        "message": f"Data appended to model {model_name} successfully.",
-        "appended_data": resolved_data,
+        "message": f"Model {model_name} compacted into {_base_path(model_name)}.",
+        "merged_segments": len(manifest["segments"]),
+        "combinations_count": row_count,
     }
 
 
-def refresh_analytics_model(
-    model_name: str, key_members: list[str], filters_list: list[str]
+def _append_rows(request, start_index):
+    """The rows of one append request, generated from start_index when not given."""
+    resolved_data = resolve_data_from_request(
+        request.get("data"),
+        request.get("population"),
+        request.get("size"),
+        request.get("amount"),
+        start_index=start_index,
+        properties=request.get("properties"),
+    )
+    new_rows = (
+        resolved_data
+        if isinstance(resolved_data, (list, CombinationStore))
+        else [resolved_data]
+    )
+    return resolved_data, new_rows
+
+
+def _commit_appends(model_name, requests):
+    """
+    Appends the rows of several requests as one segment and one manifest
+    write. The manifest is written conditionally on the ETag it was read at;
+    when another writer got there first the segment is dropped and the
+    commit retried from the new manifest, so indexes stay contiguous and no
+    append is lost. Returns one result (or exception) per request.
+    """
+    for attempt in range(APPEND_MAX_ATTEMPTS):
+        manifest, etag = _read_manifest(model_name)
+        start_index = manifest["row_count"] + 1
+        results = []
+        parts = []
+        for request in requests:
+            try:
+                resolved_data, new_rows = _append_rows(request, start_index)
+            except Exception as e:
+                results.append(e)
+                continue
+            results.append(
+                {
+                    "status": "success",
+                    "message": f"Data appended to model {model_name} successfully.",
+                    "appended_data": resolved_data,
+                    "start_index": start_index,
+                    "end_index": start_index + len(new_rows) - 1,
+                }
+            )
+            parts.append(new_rows)
+            start_index += len(new_rows)
+        new_rows = parts[0] if len(parts) == 1 else [r for part in parts for r in part]
+        if not parts:
+            return results
+
+        # Write only the new rows as a segment, then publish it in the manifest.
+        # The name is unique, so a concurrent writer never overwrites it.
+        segment_path = (
+            f"{_segments_prefix(model_name)}/segment_"
+            f"{manifest['next_segment']:06d}_{uuid.uuid4().hex[:8]}.json"
+        )
+        segment_client = get_container_client().get_blob_client(segment_path)
+        upload_json(segment_client, new_rows)
+        manifest["segments"].append({"path": segment_path, "rows": len(new_rows)})
+        manifest["row_count"] += len(new_rows)
+        manifest["next_segment"] += 1
+        manifest["columnar"] = bool(
+            manifest.get("columnar")
+            or any(request.get("binary_format") for request in requests)
+        )
+        manifest["population"] = next(
+            (r["population"] for r in requests if r.get("population")),
+            manifest.get("population"),
+        )
+        try:
+            save_manifest(model_name, manifest, etag, conditional=True)
+            break
+        except HttpResponseError as e:
+            if not _write_conflict(e):
+                raise
+            try:
+                segment_client.delete_blob()
+            except ResourceNotFoundError:
+                pass
+            time.sleep(random.uniform(0, APPEND_RETRY_DELAY * 2**attempt))
+    else:
+        raise RuntimeError(
+            f"Could not append to model {model_name}: "
+            f"the manifest kept changing after {APPEND_MAX_ATTEMPTS} attempts."
+        )
+
+    # Only the new rows are added to the export; once it holds them, compaction
+    # just points the manifest at it instead of rewriting the model.
+    _sync_export_after_append(model_name, manifest, new_rows)
+    if len(manifest["segments"]) > COMPACTION_SEGMENT_LIMIT:
+        try:
+            compact_model(model_name)
+            manifest = load_manifest(model_name)
+        except Exception:
+            # The rows are already committed, so a failed compaction (e.g. lost
+            # to a concurrent append) must not fail the append; a later one retries.
+            logger.warning("Compaction of model %s failed.", model_name, exc_info=True)
+
+    # Keep persisted analytics current without a full recompute.
+    analytics_updated = False
+    state = load_analytics_state(model_name)
+    if state is not None and state["row_count"] > manifest["row_count"]:
+        # A later commit from another instance already folded these rows in.
+        analytics_updated = True
+    elif state is not None:
+        try:
+            _advance_analytics(model_name, state, manifest, new_rows)
+            analytics_updated = True
+        except Exception:
+            # The next RefreshActualsAnalytics catches up from the stored state.
+            logger.warning(
+                "Analytics of model %s not updated.", model_name, exc_info=True
+            )
+
+    for result in results:
+        if isinstance(result, dict):
+            result["analytics_updated"] = analytics_updated
+            result["coalesced_requests"] = len(parts)
+    return results
+
+
+# Concurrent appends to one model within the window share one commit.
+append_queue = CoalescingQueue(_commit_appends, APPEND_COALESCE_WINDOW)
+
+
+def append_to_model(
+    model_name,
+    data=None,
+    population=None,
+    size=None,
+    amount=None,
+    binary_format=False,
+    properties=None,
 ):
     """
-    Refreshes the analytics for a given model and saves or overwrites results in a blob.
+    Appends rows to an actual model. Concurrent calls for the same model on
+    this instance are coalesced into one segment and manifest write; each
+    caller gets back its own rows and their start_index/end_index.
     """
     if not model_name:
         raise ValueError("Model name must be provided.")
 
-    path = f"actualModels/{model_name}.json"
-    analythics_path = f"actualModels/{model_name}_analytics.json"
+    request = {
+        "data": data,
+        "population": population,
+        "size": size,
+        "amount": amount,
+        "binary_format": binary_format,
+        "properties": properties,
+    }
+    if current_session() is not None:
+        # Batches already run their operations one after another.
+        result = _commit_appends(model_name, [request])[0]
+    else:
+        result = append_queue.submit(model_name, request)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
 
-    blob_client = container_client.get_blob_client(path)
+def _analytics_state_client(model_name):
+    return get_container_client().get_blob_client(
+        f"actualModels/{model_name}_analytics_state.json"
+    )
 
-    try:
-        model_data = json.loads(blob_client.download_blob().readall())
-    except Exception as e:
-        return {"status": "error", "message": f"Failed to load model data: {str(e)}"}
 
-    #  Refresh analytics
-    analytics = refresh_analytics(model_data, key_members, filters_list)
+def load_analytics_state(model_name):
+    """Loads the persisted incremental analytics state, or None if there is none."""
+    try:
+        return read_json(_analytics_state_client(model_name))
+    except ResourceNotFoundError:
+        return None
 
-    # Save analytics to blob
-    analytics_blob_client = container_client.get_blob_client(analythics_path)
 
+def _delete_analytics_state(model_name):
     try:
-        analytics_blob_client.upload_blob(
-            json.dumps(analytics, indent=2), overwrite=True
+        _analytics_state_client(model_name).delete_blob()
+    except ResourceNotFoundError:
+        pass
+
+
+def _advance_analytics(model_name, state, manifest, tail_rows=None, columns=None):
+    """
+    Folds the rows the state has not seen yet into it, then saves both the
+    analytics output and the state.
+    """
+    analytics = _compute_analytics(model_name, state, manifest, tail_rows, columns)
+    _save_analytics(model_name, state, analytics)
+    return analytics
+
+
+def _compute_analytics(model_name, state, manifest, tail_rows=None, columns=None):
+    """
+    Folds the rows the state has not seen yet into it and returns the analytics.
+    tail_rows are used as-is when they are exactly the missing rows; otherwise
+    the missing rows are read from storage.
+    """
+    seen = state["row_count"]
+    missing = manifest["row_count"] - seen
+    if missing:
+        if tail_rows is None or len(tail_rows) != missing:
+            tail_rows = load_model_rows(
+                model_name, columns, manifest=manifest, first_row=seen
+            )
+        update_analytics_state(state, tail_rows)
+    analytics = analytics_from_state(state)
+    if state.get("windows"):
+        analytics = _with_windows(
+            model_name, state, manifest, analytics, seen, tail_rows, columns
         )
+    return analytics
+
+
+def _save_analytics(model_name, state, analytics):
+    """Writes the analytics output and the state it was computed from."""
+    upload_bytes(
+        get_container_client().get_blob_client(
+            f"actualModels/{model_name}_analytics.json"
+        ),
+        json.dumps(analytics, indent=2),
+    )
+    upload_bytes(_analytics_state_client(model_name), json.dumps(state))
+
+
+def _with_windows(
+    model_name, state, manifest, analytics, seen, new_rows=None, columns=None
+):
+    """
+    Adds the rolling-window metrics of the state's windows to the analytics.
+    They only depend on the last max(windows) rows, which the state keeps as
+    "recent": the rows folded in since (new_rows) extend it, and the model is
+    only read when it holds fewer rows than the windows need (first refresh,
+    a larger window).
+    Args:
+        seen (int): The row count of the state before new_rows were folded in.
+    """
+    span = max(state["windows"])
+    recent = state.get("recent") or []
+    if len(recent) >= min(span, seen):
+        rows = recent + recent_rows(state, (new_rows or [])[-span:])
+    else:
+        first_row = max(manifest["row_count"] - span, 0)
+        rows = recent_rows(
+            state,
+            load_model_rows(
+                model_name, columns, manifest=manifest, first_row=first_row
+            ),
+        )
+    rows = rows[-span:]
+    state["recent"] = rows
+    windowed = refresh_windowed_analytics(
+        rows, state["key_members"], state["filters_list"], state["windows"]
+    )
+    by_key = {entry["key"]: entry for entry in analytics}
+    for entry in windowed:
+        by_key.setdefault(entry["key"], {"key": entry["key"]}).update(
+            (k, v) for k, v in entry.items() if k != "key"
+        )
+    return list(by_key.values())
+
+
+def refresh_analytics_model(
+    model_name: str,
+    key_members: list[str],
+    filters_list: list[str],
+    windows: list[int] = None,
+):
+    """
+    Refreshes the analytics for a given model and saves or overwrites results in a blob.
+    A persisted state for the same key members and filters is advanced over the
+    rows appended since it was saved; when it is already current nothing is
+    recomputed. windows adds rolling-window metrics over the last N rows, kept
+    current by later appends too.
+    """
+    if not model_name:
+        raise ValueError("Model name must be provided.")
+    windows = list(normalize_windows(windows))
+
+    try:
+        manifest = load_manifest(model_name)
+        state = load_analytics_state(model_name)
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to load model data: {str(e)}"}
+    if not manifest["segments"]:
         return {
-            "status": "success",
-            "message": f"Analytics for model {model_name} refreshed and saved successfully.",
-            "combinations_count": len(model_data),
-            "key_members": key_members,
-            "filters_list": filters_list,
+            "status": "error",
+            "message": f"Failed to load model data: model {model_name} not found.",
         }
+
+    result = {
+        "status": "success",
+        "message": f"Analytics for model {model_name} refreshed and saved successfully.",
+        "combinations_count": manifest["row_count"],
+        "key_members": key_members,
+        "filters_list": filters_list,
+    }
+    if windows:
+        result["windows"] = windows
+
+    reusable = (
+        state is not None
+        and state_matches(state, key_members, filters_list)
+        and state["row_count"] <= manifest["row_count"]
+    )
+    if (
+        reusable
+        and state["row_count"] == manifest["row_count"]
+        and state.get("windows", []) == windows
+    ):
+        return {**result, "up_to_date": True}
+    if reusable:
+        state["windows"] = windows
+    else:
+        state = new_analytics_state(key_members, filters_list, windows)
+
+    # Only numbers and the filtered columns are needed from the columnar copy.
+    analytics = _compute_analytics(
+        model_name,
+        state,
+        manifest,
+        columns=["numbers", *filter_keys(filters_list)],
+    )
+    try:
+        _save_analytics(model_name, state, analytics)
     except Exception as e:
         return {"status": "error", "message": f"Failed to save analytics: {str(e)}"}
+    return result
@@ -0,0 +1,304 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+from utils.requestMetrics import record, stage
+
+# Session of the batch being handled by the current thread/task, if any.
+_current = contextvars.ContextVar("blob_session", default=None)
+
+
+def not_modified_error():
+    """The error the storage SDK raises for a 304 to a conditional download."""
+    error = HttpResponseError("The condition specified was not met.")
+    error.status_code = 304
+    return error
+
+
+class SessionConflictError(Exception):
+    """
+    A blob the session wrote conditionally changed in the container since the
+    session read it. written tells whether some pending writes had already
+    reached the container; when it is False, nothing was written.
+    """
+
+    def __init__(self, path, written):
+        super().__init__(f"Blob {path} was changed by another writer.")
+        self.path = path
+        self.written = written
+
+
+def current_session():
+    """The active BlobSession, or None outside of a batch."""
+    return _current.get()
+
+
+class BlobSession:
+    """
+    Read-through, write-back view of a container for the operations of one
+    batch. Every blob is downloaded at most once; writes and deletes are kept
+    in memory (later ones replace earlier ones, and reads see them) and reach
+    the container once, in the order of their last change, when flush is called.
+    A blob whose first write in the session is conditional (an ETag it was
+    read at, or IfMissing) is written under that condition when flushed.
+    Parsed row lists are shared between the operations and must not be
+    mutated; other JSON documents are parsed again for every reader.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._downloads = {}
+        self._parsed = {}
+        self._missing = set()
+        # path -> pending blob dict (data, metadata, content_settings), or None for a delete
+        self._pending = {}
+        # path -> condition of the first conditional write, against the container
+        self._conditions = {}
+        # key -> callback run once the pending writes reached the container
+        self._after_flush = {}
+        self.downloads = 0
+        self.written = []
+
+    def wrap(self, container_client):
+        return _SessionContainerClient(self, container_client)
+
+    def _forget(self, path):
+        self._parsed.pop(path, None)
+        self._downloads.pop(path, None)
+        self._missing.discard(path)
+
+    def _write(self, path, blob, conditions=None):
+        with self._lock:
+            if conditions and path not in self._pending:
+                self._conditions.setdefault(path, conditions)
+            self._forget(path)
+            # re-inserted so the flush follows the order of the last changes
+            self._pending.pop(path, None)
+            self._pending[path] = blob
+
+    def _read(self, path, client, conditions):
+        """(data, etag) of a blob; pending writes have no etag yet.
+        An IfModified condition on the etag already downloaded raises the
+        HttpResponseError with status 304 the storage SDK raises."""
+        with self._lock:
+            if path in self._pending:
+                blob = self._pending[path]
+                if blob is None:
+                    raise ResourceNotFoundError("The specified blob does not exist.")
+                return blob["data"], None
+            if path in self._downloads:
+                data, etag = self._downloads[path]
+                if (
+                    conditions.get("match_condition") == MatchConditions.IfModified
+                    and conditions.get("etag") == etag
+                ):
+                    raise not_modified_error()
+                return data, etag
+            if path in self._missing:
+                raise ResourceNotFoundError("The specified blob does not exist.")
+        try:
+            downloader = client.download_blob(**conditions)
+            data = downloader.readall()
+        except ResourceNotFoundError:
+            with self._lock:
+                self._missing.add(path)
+            raise
+        etag = downloader.properties.etag
+        with self._lock:
+            self.downloads += 1
+            self._downloads.setdefault(path, (data, etag))
+        return data, etag
+
+    def read_json(self, path, load):
+        """Parses a blob through load once per batch when it holds a row list."""
+        cached = self._parsed.get(path)
+        if cached is not None:
+            return cached
+        value = load()
+        if isinstance(value, list):
+            with self._lock:
+                if path not in self._pending:
+                    self._parsed[path] = value
+        return value
+
+    def after_flush(self, key, callback):
+        """Runs callback (once per key) after flush, outside of the session."""
+        self._after_flush.setdefault(key, callback)
+
+    @property
+    def pending_writes(self):
+        return len(self._pending)
+
+    def flush(self, container_client, max_concurrency=1):
+        """
+        Writes every pending blob and delete to the container, once each.
+        Conditional blobs are checked before anything is written.
+        Raises:
+            SessionConflictError: If a conditional blob changed meanwhile.
+        """
+        for path, conditions in self._conditions.items():
+            if self._pending.get(path) is not None and not _holds(
+                container_client.get_blob_client(path), conditions
+            ):
+                raise SessionConflictError(path, written=False)
+        pending, self._pending = self._pending, {}
+        for path, blob in pending.items():
+            client = container_client.get_blob_client(path)
+            if blob is None:
+                try:
+                    client.delete_blob()
+                except ResourceNotFoundError:
+                    pass
+                continue
+            try:
+                with stage("blob_upload"):
+                    client.upload_blob(
+                        blob["data"],
+                        overwrite=True,
+                        metadata=blob["metadata"],
+                        content_settings=blob["content_settings"],
+                        max_concurrency=max_concurrency,
+                        **self._conditions.get(path, {}),
+                    )
+            except (ResourceModifiedError, ResourceExistsError) as e:
+                raise SessionConflictError(path, written=bool(self.written)) from e
+            record("blob_upload", bytes=len(blob["data"]))
+            self.written.append(path)
+        callbacks, self._after_flush = self._after_flush, {}
+        for callback in callbacks.values():
+            callback()
+        return self.written
+
+
+def _holds(client, conditions):
+    """True when the container blob still matches a write condition."""
+    try:
+        etag = client.get_blob_properties().etag
+    except ResourceNotFoundError:
+        etag = None
+    if conditions["match_condition"] == MatchConditions.IfMissing:
+        return etag is None
+    return etag == conditions["etag"]
+
+
+class _SessionContainerClient:
+    def __init__(self, session, container_client):
+        self._session = session
+        self._container_client = container_client
+
+    def get_blob_client(self, blob):
+        return _SessionBlobClient(
+            self._session, self._container_client.get_blob_client(blob), blob
+        )
+
+
+class _Download:
+    def __init__(self, data, etag):
+        self._data = data
+        self.properties = SimpleNamespace(etag=etag)
+
+    def readall(self):
+        return self._data
+
+
+class _SessionBlobClient:
+    """The blob client calls utils.blobHandler makes, served by a BlobSession."""
+
+    def __init__(self, session, client, name):
+        self._session = session
+        self._client = client
+        self.blob_name = name
+        self._staged = {}
+
+    def download_blob(self, etag=None, match_condition=None, **kwargs):
+        conditions = {}
+        if match_condition is not None:
+            conditions = {"etag": etag, "match_condition": match_condition}
+        return _Download(*self._session._read(self.blob_name, self._client, conditions))
+
+    def upload_blob(
+        self,
+        data,
+        overwrite=False,
+        metadata=None,
+        content_settings=None,
+        etag=None,
+        match_condition=None,
+        **kwargs,
+    ):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        conditions = None
+        if match_condition is not None:
+            conditions = {"etag": etag, "match_condition": match_condition}
+        self._session._write(
+            self.blob_name,
+            {
+                "data": bytes(data),
+                "metadata": dict(metadata or {}),
+                "content_settings": content_settings,
+            },
+            conditions,
+        )
+
+    def stage_block(self, block_id, data, **kwargs):
+        self._staged[block_id] = bytes(data)
+
+    def commit_block_list(
+        self, block_list, metadata=None, content_settings=None, **kwargs
+    ):
+        data = b"".join(self._staged.pop(block.id) for block in block_list)
+        self.upload_blob(
+            data, metadata=metadata, content_settings=content_settings, **kwargs
+        )
+
+    def delete_blob(self, **kwargs):
+        if not self.exists():
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        self._session._write(self.blob_name, None)
+
+    def _known(self):
+        session = self._session
+        with session._lock:
+            if self.blob_name in session._missing:
+                return True, None
+            return self.blob_name in session._pending, session._pending.get(
+                self.blob_name
+            )
+
+    def exists(self, **kwargs):
+        known, blob = self._known()
+        if known:
+            return blob is not None
+        return self.blob_name in self._session._downloads or self._client.exists()
+
+    def get_blob_properties(self, **kwargs):
+        known, blob = self._known()
+        if not known:
+            return self._client.get_blob_properties()
+        if blob is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        return SimpleNamespace(
+            name=self.blob_name,
+            size=len(blob["data"]),
+            metadata=dict(blob["metadata"]),
+            content_settings=blob["content_settings"],
+        )
+
+
+@contextmanager
+def session_scope():
+    """Routes the blob calls of the enclosed block through a new BlobSession."""
+    session = BlobSession()
+    token = _current.set(session)
+    try:
+        yield session
+    finally:
+        _current.reset(token)
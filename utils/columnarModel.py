@@ -0,0 +1,389 @@
+import json
+import mmap
+import struct
+import numpy as np
+from utils.combinPropertiesFunctions import generate_boxes, level_members
+from utils.combinationStore import CombinationStore
+
+# Binary layout: MAGIC, uint32 version, uint32 header length, JSON header,
+# then every column buffer aligned to 8 bytes. Offsets in the header are
+# relative to the (aligned) end of the header, so readers can slice columns
+# straight out of a memory map.
+MAGIC = b"RMCM"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<4sII")
+_ALIGN = 8
+
+# Columns whose value is a pure function of (index, numbers, population_size)
+# are not stored at all, as long as every row matches the derivation.
+DERIVED_COLUMNS = {
+    "boxes": lambda index, numbers, population_size: generate_boxes(numbers, index)[1],
+    "level_members": lambda index, numbers, population_size: level_members(
+        numbers, population_size
+    )[1],
+}
+
+
+def _data_start(header_length):
+    """Offset of the first column buffer for a header of the given length."""
+    end = _PREAMBLE.size + header_length
+    return end + (-end % _ALIGN)
+
+
+def _derive(name, index, numbers, population_size):
+    """Computes a derived column for index and numbers arrays."""
+    derive = DERIVED_COLUMNS[name]
+    return [
+        derive(i, n, population_size) for i, n in zip(index.tolist(), numbers.tolist())
+    ]
+
+
+def _int_dtype(values):
+    """Smallest dtype able to hold every value of an integer array."""
+    if values.size == 0:
+        return np.dtype(np.uint8)
+    low, high = int(values.min()), int(values.max())
+    for dtype in (np.uint8, np.uint16, np.uint32) if low >= 0 else ():
+        if high <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    for dtype in (np.int32, np.int64):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError("Integer column does not fit in 64 bits.")
+
+
+class _DictionaryColumn:
+    """Accumulates a dictionary-encoded column chunk by chunk."""
+
+    def __init__(self):
+        self.lookup = {}
+        self.values = []
+        self.codes = []
+
+    def append(self, values):
+        codes = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            key = value if isinstance(value, str) else json.dumps(value)
+            code = self.lookup.get(key)
+            if code is None:
+                code = self.lookup[key] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        self.codes.append(codes)
+
+    def append_encoded(self, labels, codes):
+        """Adds a chunk that is already dictionary-encoded as (labels, codes)."""
+        self.append(labels)
+        remap = self.codes.pop()
+        self.codes.append(remap[np.asarray(codes, dtype=np.int64)])
+
+
+class ColumnarWriter:
+    """Builds the columnar binary representation of a model incrementally.
+    Every row must carry a fixed-width "numbers" list. Only the keys shared by
+    every row are stored; when rows differ the copy is marked partial, and a
+    missing "index" is stored as the row position but not exported.
+    """
+
+    def __init__(self, population=None):
+        self.population = population
+        self.population_size = len(population) if population else 28
+        self.row_count = 0
+        self.partial = False
+        self._keys = None
+        self._index = []
+        self._numbers = []
+        self._columns = {}
+        self._derived = set(DERIVED_COLUMNS)
+
+    def append(self, rows):
+        """Adds a chunk of model rows (dicts, or a CombinationStore) to the columns."""
+        if isinstance(rows, CombinationStore) and self._append_store(rows):
+            return
+        rows = list(rows)
+        if not rows:
+            return
+        if any("numbers" not in row for row in rows):
+            raise ValueError("Columnar models require 'numbers' in every row.")
+        if self._keys is None:
+            self._keys = list(rows[0])
+            self._columns = {
+                k: _DictionaryColumn()
+                for k in self._keys
+                if k not in ("index", "numbers")
+            }
+            self._derived &= set(self._columns)
+        self._keep_shared_keys(rows)
+
+        index = np.fromiter(
+            (row.get("index", self.row_count + i + 1) for i, row in enumerate(rows)),
+            dtype=np.int64,
+            count=len(rows),
+        )
+        numbers = np.asarray([row["numbers"] for row in rows], dtype=np.int64)
+        if numbers.ndim != 2 or (
+            self._numbers and numbers.shape[1] != self._numbers[0].shape[1]
+        ):
+            raise ValueError("Columnar models require fixed-size 'numbers'.")
+
+        for name, column in self._columns.items():
+            values = [row[name] for row in rows]
+            if name in self._derived:
+                if values == _derive(name, index, numbers, self.population_size):
+                    continue
+                # no longer derivable: materialize the rows seen so far
+                self._derived.discard(name)
+                for previous_index, previous_numbers in zip(self._index, self._numbers):
+                    column.append(
+                        _derive(
+                            name, previous_index, previous_numbers, self.population_size
+                        )
+                    )
+            column.append(values)
+
+        self._index.append(index)
+        self._numbers.append(numbers)
+        self.row_count += len(rows)
+
+    def _keep_shared_keys(self, rows):
+        """Drops the keys some rows lack; keys only some rows have are not stored."""
+        shared = set(self._keys).intersection(*(row.keys() for row in rows))
+        dropped = [key for key in self._keys if key not in shared]
+        if dropped or any(row.keys() - shared for row in rows):
+            self.partial = True
+        for key in dropped:
+            self._keys.remove(key)
+            self._columns.pop(key, None)
+            self._derived.discard(key)
+
+    def _append_store(self, store):
+        """
+        Appends a CombinationStore column by column, reusing its arrays and
+        dictionaries instead of building its rows. Returns False when the store
+        does not line up with the columns written so far.
+        """
+        keys = list(store[0]) if len(store) else None
+        if (
+            keys is None
+            or store.population_size != self.population_size
+            or (self._keys is not None and keys != self._keys)
+            or (self._numbers and store.numbers.shape[1] != self._numbers[0].shape[1])
+        ):
+            return False
+        if self._keys is None:
+            self._keys = keys
+            self._columns = {
+                k: _DictionaryColumn() for k in keys if k not in ("index", "numbers")
+            }
+            self._derived &= set(self._columns)
+
+        index = np.arange(store.start_index, store.start_index + len(store))
+        numbers = store.numbers.astype(np.int64)
+        for name, column in self._columns.items():
+            if name in self._derived:
+                # the store derives these exactly like DERIVED_COLUMNS
+                continue
+            encoded = store.dictionary_column(name)
+            if encoded is not None:
+                column.append_encoded(*encoded)
+            else:
+                column.append([store.value(row, name) for row in range(len(store))])
+
+        self._index.append(index)
+        self._numbers.append(numbers)
+        self.row_count += len(store)
+        return True
+
+    def to_bytes(self):
+        """Serializes the accumulated columns into the binary format."""
+        buffers = []
+        specs = []
+        offset = 0
+
+        def add(array):
+            nonlocal offset
+            data = np.ascontiguousarray(array).tobytes()
+            buffers.append(data)
+            buffers.append(b"\0" * (-len(data) % _ALIGN))
+            spec = {
+                "offset": offset,
+                "dtype": array.dtype.str,
+                "count": int(array.size),
+            }
+            offset += len(data) + (-len(data) % _ALIGN)
+            return spec
+
+        index = np.concatenate(self._index) if self._index else np.empty(0, np.int64)
+        numbers = (
+            np.concatenate(self._numbers)
+            if self._numbers
+            else np.empty((0, 0), np.int64)
+        )
+        specs.append(
+            {"name": "index", "kind": "int", **add(index.astype(_int_dtype(index)))}
+        )
+        specs.append(
+            {
+                "name": "numbers",
+                "kind": "matrix",
+                "width": int(numbers.shape[1]),
+                **add(numbers.astype(_int_dtype(numbers))),
+            }
+        )
+        for name, column in self._columns.items():
+            if name in self._derived:
+                specs.append({"name": name, "kind": "derived"})
+                continue
+            codes = np.concatenate(column.codes)
+            dictionary = np.frombuffer(
+                json.dumps(column.values).encode("utf-8"), np.uint8
+            )
+            specs.append(
+                {
+                    "name": name,
+                    "kind": "dictionary",
+                    **add(codes.astype(_int_dtype(codes))),
+                    "dictionary": add(dictionary),
+                }
+            )
+
+        header = {
+            "version": FORMAT_VERSION,
+            "population": self.population,
+            "population_size": self.population_size,
+            "size": int(numbers.shape[1]),
+            "rows": self.row_count,
+            "key_order": self._keys or ["index", "numbers"],
+            "partial": self.partial,
+            "columns": specs,
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        padding = _data_start(len(header_bytes)) - _PREAMBLE.size - len(header_bytes)
+        return b"".join(
+            [
+                _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)),
+                header_bytes,
+                b" " * padding,
+                *buffers,
+            ]
+        )
+
+
+def encode_model(rows, population=None):
+    """Encodes a list of model rows into the columnar binary format."""
+    writer = ColumnarWriter(population)
+    writer.append(rows)
+    return writer.to_bytes()
+
+
+class ColumnarModel:
+    """Read-only view over a columnar model held in bytes, a bytearray or an mmap.
+    Columns are decoded lazily; numeric columns are zero-copy numpy views.
+    """
+
+    def __init__(self, buffer):
+        magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Buffer is not a columnar model.")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar model version {version}.")
+        self._buffer = buffer
+        self.header = json.loads(
+            bytes(buffer[_PREAMBLE.size : _PREAMBLE.size + header_length])
+        )
+        self.population = self.header["population"]
+        self.size = self.header["size"]
+        self._specs = {spec["name"]: spec for spec in self.header["columns"]}
+        self._data_start = _data_start(header_length)
+        self._dictionaries = {}
+
+    def __len__(self):
+        return self.header["rows"]
+
+    @property
+    def nbytes(self):
+        """Size of the underlying buffer."""
+        return len(self._buffer)
+
+    @property
+    def partial(self):
+        """True when the source rows did not share the same keys, so the rows
+        rebuilt from this copy lack some of their values."""
+        return bool(self.header.get("partial"))
+
+    @property
+    def columns(self):
+        """Column names, in the key order of the original rows."""
+        return list(self.header["key_order"])
+
+    def _array(self, spec):
+        return np.frombuffer(
+            self._buffer,
+            dtype=spec["dtype"],
+            count=spec["count"],
+            offset=self._data_start + spec["offset"],
+        )
+
+    def index(self):
+        """The row indexes as a numpy array."""
+        return self._array(self._specs["index"])
+
+    def numbers(self):
+        """The combinations as an (N, k) numpy array."""
+        spec = self._specs["numbers"]
+        return self._array(spec).reshape(len(self), spec["width"])
+
+    def codes(self, name):
+        """Dictionary codes of a property column, one per row."""
+        return self._array(self._specs[name])
+
+    def dictionary(self, name):
+        """Distinct values of a dictionary-encoded property column."""
+        if name not in self._dictionaries:
+            raw = self._array(self._specs[name]["dictionary"])
+            self._dictionaries[name] = json.loads(raw.tobytes())
+        return self._dictionaries[name]
+
+    def values(self, name):
+        """Decodes a single column into one Python value per row."""
+        spec = self._specs[name]
+        if spec["kind"] == "int":
+            return (
+                self.index().tolist() if name == "index" else self._array(spec).tolist()
+            )
+        if spec["kind"] == "matrix":
+            return self.numbers().tolist()
+        if spec["kind"] == "derived":
+            population_size = self.header["population_size"]
+            return _derive(name, self.index(), self.numbers(), population_size)
+        dictionary = self.dictionary(name)
+        return [dictionary[code] for code in self.codes(name).tolist()]
+
+    def encoded_column(self, name):
+        """
+        A column as (distinct values as strings, per-row codes), the form
+        utils.filterCompiler.evaluate_filters builds its masks from.
+        """
+        if name not in self._specs:
+            return ["None"], np.zeros(len(self), dtype=np.int64)
+        if self._specs[name]["kind"] == "dictionary":
+            return [str(v) for v in self.dictionary(name)], self.codes(name)
+        lookup = {}
+        codes = np.fromiter(
+            (lookup.setdefault(str(v), len(lookup)) for v in self.values(name)),
+            dtype=np.int64,
+            count=len(self),
+        )
+        return list(lookup), codes
+
+    def to_dicts(self, columns=None):
+        """Rebuilds row dicts, decoding only the requested columns (default all)."""
+        names = [c for c in self.columns if columns is None or c in columns]
+        decoded = [self.values(name) for name in names]
+        return [dict(zip(names, row)) for row in zip(*decoded)] if names else []
+
+
+def open_columnar(path):
+    """Memory-maps a columnar model file from local disk."""
+    with open(path, "rb") as file:
+        return ColumnarModel(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
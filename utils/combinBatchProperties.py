@@ -0,0 +1,201 @@
+from itertools import chain
+import math
+import numpy as np
+
+
+def as_combination_array(combinations):
+    """Convert an iterable of equally sized combinations into a sorted (N, k) array.
+    Args:
+        combinations (Iterable[Iterable[int]]): The raw combinations.
+    Returns:
+        numpy.ndarray: An int64 array with one sorted combination per row.
+    """
+    if not isinstance(combinations, (list, np.ndarray)):
+        combinations = list(combinations)
+    arr = np.asarray(combinations, dtype=np.int64)
+    if arr.ndim != 2:
+        arr = arr.reshape(len(arr), -1)
+    arr.sort(axis=1)
+    return arr
+
+
+def combination_array(combinations, population, size, count):
+    """Fill the sorted (count, size) array of a known number of combinations
+    drawn from population, straight from their iterator: no per-row tuples are
+    kept and the array starts in the smallest dtype holding every member.
+    Args:
+        combinations (Iterable[Iterable[int]]): Exactly count combinations, e.g. itertools.combinations.
+        population (list[int]): The members the combinations are drawn from.
+        size (int): The number of members in each combination.
+        count (int): The number of combinations.
+    Returns:
+        numpy.ndarray: One sorted combination per row.
+    """
+    members = list(population)
+    dtype = np.int64
+    if members and all(isinstance(m, int) and m >= 0 for m in members):
+        dtype = np.min_scalar_type(max(members))
+    arr = np.fromiter(
+        chain.from_iterable(combinations), dtype=dtype, count=count * size
+    ).reshape(count, size)
+    if members != sorted(members):
+        # itertools.combinations keeps the population order
+        arr.sort(axis=1)
+    return arr
+
+
+def _compact_codes(inverse, labels):
+    """Per-row dictionary codes in the smallest unsigned dtype indexing labels."""
+    return inverse.reshape(-1).astype(np.min_scalar_type(max(len(labels) - 1, 0)))
+
+
+def _encode_rows(matrix, base):
+    """Map every row of a small non-negative integer matrix to a dictionary code.
+    Returns the unique rows (as a list of tuples) and the per-row code.
+    """
+    width = matrix.shape[1]
+    if width == 0:
+        return [()], np.zeros(len(matrix), dtype=np.int64)
+    if base**width < 2**62:
+        # column by column, so only one int64 column is ever materialized
+        codes = np.zeros(len(matrix), dtype=np.int64)
+        for position, column in enumerate(matrix.T):
+            codes += column.astype(np.int64) * base**position
+        _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+        uniques = [tuple(row) for row in matrix[first].tolist()]
+    else:
+        unique_rows, inverse = np.unique(matrix, axis=0, return_inverse=True)
+        uniques = [tuple(row) for row in unique_rows.tolist()]
+    return uniques, _compact_codes(inverse, uniques)
+
+
+def level_counts(arr, population_size=28):
+    """Count the members of every combination that fall in each level of 10.
+    Args:
+        arr (numpy.ndarray): (N, k) array of combinations.
+        population_size (int): The maximum number of population used to build combinations.
+    Returns:
+        numpy.ndarray: (N, levels) array of counts.
+    """
+    levels = (population_size // 10) + 1
+    valid = (arr >= 1) & (arr <= population_size)
+    level_of = np.where(valid, (arr - 1) // 10, -1)
+    counts = np.zeros((len(arr), levels), dtype=np.min_scalar_type(arr.shape[1]))
+    for level in range(levels):
+        counts[:, level] = (level_of == level).sum(axis=1)
+    return counts
+
+
+def encode_level_key(arr, population_size=28):
+    """Dictionary-encoded level_key of every row of an (N, k) combination array.
+    Returns:
+        tuple[list[str], numpy.ndarray]: The distinct level keys and one code per row.
+    """
+    counts = level_counts(arr, population_size)
+    uniques, inverse = _encode_rows(counts, arr.shape[1] + 1)
+    return ["-".join(map(str, row)) for row in uniques], inverse
+
+
+def sequence_breaks(arr):
+    """Flag, for every adjacent pair of sorted members, whether the run breaks there.
+    Returns:
+        numpy.ndarray: (N, k-1) boolean array, True where arr[:, i+1] != arr[:, i] + 1.
+    """
+    return arr[:, 1:] != arr[:, :-1] + 1
+
+
+def _runs_from_breaks(breaks):
+    """Turn one row of break flags into the run lengths used by sequence_key."""
+    groups = []
+    count = 1
+    for is_break in breaks:
+        if is_break:
+            groups.append(count)
+            count = 1
+        else:
+            count += 1
+    groups.append(count)
+    return groups
+
+
+def encode_sequence_key(arr):
+    """Dictionary-encoded sequence_key of every row of an (N, k) combination array.
+    Returns:
+        tuple[list[str], numpy.ndarray]: The distinct sequence keys and one code per row.
+    """
+    uniques, inverse = _encode_rows(sequence_breaks(arr), 2)
+    return ["-".join(map(str, _runs_from_breaks(row))) for row in uniques], inverse
+
+
+def prime_table(limit):
+    """Sieve of Eratosthenes returning a boolean lookup table for 0..limit."""
+    table = np.ones(max(limit, 1) + 1, dtype=bool)
+    table[:2] = False
+    for n in range(2, int(limit**0.5) + 1):
+        if table[n]:
+            table[n * n :: n] = False
+    return table
+
+
+def prime_counts(arr):
+    """Count the prime members of every row of an (N, k) combination array."""
+    if arr.size == 0:
+        return np.zeros(len(arr), dtype=np.int64)
+    table = prime_table(int(arr.max()))
+    return table[np.clip(arr, 0, None)].sum(axis=1)
+
+
+def encode_prime_count(arr):
+    """Dictionary-encoded prime_count of every row; the code is the count itself.
+    Returns:
+        tuple[list[str], numpy.ndarray]: The labels "0".."k" and one count per row.
+    """
+    return [str(i) for i in range(arr.shape[1] + 1)], prime_counts(arr)
+
+
+def decimal_label(value):
+    """Format a ratio property: two decimals at most, no trailing zeros (6.25, 12.2, 13)."""
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def _encode_values(keys, label):
+    """Dictionary-encode an integer key per row, labelling each distinct key once."""
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    return [label(u) for u in uniques.tolist()], _compact_codes(inverse, uniques)
+
+
+def encode_gap_properties(arr):
+    """Dictionary-encoded gap and arithmetic properties of every row of an (N, k)
+    combination array, from one sorted-difference pass: the gaps between sorted
+    members, the member sum and the sum of squares. Every label is formatted
+    from an exact integer key (gap span, sum, k * sum of squares - sum ** 2),
+    so the values match the per-row functions.
+    Returns:
+        dict[str, tuple[list[str], numpy.ndarray]]: Property name -> (labels, codes).
+    """
+    k = arr.shape[1]
+    # rows are sorted, so the gaps fit the dtype of the array itself; sums are
+    # accumulated in int64 column by column instead of widening the whole array
+    gaps = np.diff(arr, axis=1)
+    total = arr.sum(axis=1, dtype=np.int64)
+    squares = np.zeros(len(arr), dtype=np.int64)
+    for column in arr.T:
+        column = column.astype(np.int64)
+        squares += column * column
+    spread = k * squares - total * total
+    encoded = {}
+    uniques, inverse = _encode_rows(gaps, int(gaps.max(initial=0)) + 1)
+    encoded["gap_variance"] = (["-".join(map(str, row)) for row in uniques], inverse)
+    encoded["max_gap"] = _encode_values(
+        gaps.max(axis=1, initial=0), lambda gap: str(gap)
+    )
+    encoded["avg_gap"] = _encode_values(
+        arr[:, -1] - arr[:, 0] if k > 1 else np.zeros(len(arr), np.int64),
+        lambda span: decimal_label(span / (k - 1) if k > 1 else 0),
+    )
+    encoded["arith_total"] = _encode_values(total, lambda t: str(t))
+    encoded["arith_avg"] = _encode_values(total, lambda t: decimal_label(t / k))
+    encoded["arith_std"] = _encode_values(
+        spread, lambda s: decimal_label(math.sqrt(s) / k)
+    )
+    return encoded
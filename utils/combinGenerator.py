@@ -1,45 +1,199 @@
-from utils.combinPropertiesFunctions import (
-    level_key,
-    level_members,
-    sequence_key,
-    prime_count,
-    generate_boxes,
+from itertools import combinations, islice
+import numpy as np
+from utils.combinBatchProperties import combination_array
+from utils.combinationStore import CombinationStore
+from utils.combinIndex import (
+    combination_at,
+    combination_count,
+    iter_combination_range,
 )
-from itertools import combinations
-from utils.combinationModel import CombinationModel
+from utils.modelCache import ModelCache
+from utils.propertyRegistry import resolve_properties
+from utils.requestMetrics import record, stage
+import base64
+import hashlib
+import json
+import os
 import random
 
+# Number of enriched models yielded per chunk by the streaming generators.
+DEFAULT_CHUNK_SIZE = 5000
 
-def generate_all_combinations(population, size):
+# Version of the property set attached to every model. Bump it whenever a
+# property is added or its output changes, so cached full models are rebuilt.
+PROPERTIES_VERSION = 2
+
+# Rows per page of generate_combination_page when no limit is given, and the cap.
+DEFAULT_PAGE_SIZE = 5000
+MAX_PAGE_SIZE = 50000
+
+# Recently generated full models, bounded by their estimated memory footprint.
+full_model_cache = ModelCache(
+    int(os.getenv("MODEL_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    sizeof=lambda store: store.nbytes,
+)
+
+
+def full_model_cache_key(population, size, properties=None):
+    """Deterministic content key of a full model: population, size, property version
+    and, for a subset of the registered properties, the selection."""
+    content = {
+        "population": list(population),
+        "size": size,
+        "properties": PROPERTIES_VERSION,
+    }
+    selection = resolve_properties(properties)
+    if selection != resolve_properties():
+        content["selection"] = list(selection)
+    payload = json.dumps(content)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cached_full_model(population, size, properties=None):
+    """The cached full model with the given property selection, or None.
+    A subset is also served from the cached model with every property."""
+    cached = full_model_cache.get(full_model_cache_key(population, size, properties))
+    if cached is None and properties is not None:
+        everything = full_model_cache.get(full_model_cache_key(population, size))
+        if everything is not None:
+            cached = everything.select(properties)
+    return cached
+
+
+def generate_all_combinations(population, size, properties=None):
     """Generate all unique combinations of a given size from a population.
     Args:
         population (list): The population from which to generate combinations.
         size (int): The size of each combination.
+        properties (list[str]): Properties to compute; None computes all of them.
+    Returns:
+        CombinationStore: The enriched models. Results are cached in-process and
+        shared between callers.
     """
+    cached = cached_full_model(population, size, properties)
+    if cached is not None:
+        return cached
     try:
+        total = combination_count(len(population), size)
+        with stage("generation"):
+            # filled straight from the iterator: no list of tuples is built
+            rows = combination_array(
+                combinations(population, size), population, size, total
+            )
+        record("generation", rows=total)
         result = build_combination_models(
-            list(combinations(population, size)), population_size=len(population)
+            rows, population_size=len(population), properties=properties
         )
+        full_model_cache.put(full_model_cache_key(population, size, properties), result)
     except Exception as e:
         raise RuntimeError(f"Error generating all combinations: {e}")
     finally:
         return result
 
 
-def generate_random_combinations(population, size, amount=1, start_index=1):
+def iter_all_combinations(
+    population, size, chunk_size=DEFAULT_CHUNK_SIZE, properties=None
+):
+    """Stream all unique combinations of a given size from a population.
+    Unlike generate_all_combinations, only one chunk of enriched models is
+    held in memory at a time, so C(n,k) can grow without growing peak memory.
+    Args:
+        population (list): The population from which to generate combinations.
+        size (int): The size of each combination.
+        chunk_size (int): The number of models yielded per chunk.
+        properties (list[str]): Properties to compute; None computes all of them.
+    Yields:
+        CombinationStore: Consecutive chunks of enriched models.
+    """
+    yield from iter_combination_models(
+        combinations(population, size),
+        population_size=len(population),
+        chunk_size=chunk_size,
+        properties=properties,
+    )
+
+
+def _universe_fingerprint(population, size):
+    """Short key binding a cursor to the population and size it was issued for."""
+    payload = json.dumps({"population": list(population), "size": size})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(population, size, offset):
+    """Opaque cursor pointing at the rank offset of a population/size universe."""
+    payload = json.dumps({"o": offset, "u": _universe_fingerprint(population, size)})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, population, size):
+    """Rank offset of a cursor issued by encode_cursor for the same universe.
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another universe.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset, fingerprint = payload["o"], payload["u"]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Invalid cursor.")
+    if fingerprint != _universe_fingerprint(population, size):
+        raise ValueError("Cursor was issued for a different sample or size.")
+    return offset
+
+
+def generate_combination_page(
+    population, size, offset=0, limit=DEFAULT_PAGE_SIZE, properties=None
+):
+    """Generate one page of the lexicographic sequence of all combinations.
+    The first combination of the page is unranked directly from offset, so no
+    earlier row is enumerated and every page costs O(limit * k).
+    Args:
+        population (list): The population from which to generate combinations.
+        size (int): The size of each combination.
+        offset (int): Rank of the first combination of the page (0-based).
+        limit (int): Maximum number of combinations in the page.
+        properties (list[str]): Properties to compute; None computes all of them.
+    Returns:
+        tuple[CombinationStore, int | None]: The enriched models, whose index continues
+        the full model (offset + 1 onwards), and the offset of the next page
+        (None after the last page).
+    """
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("offset must be a non-negative integer.")
+    if not isinstance(limit, int) or not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be an integer between 1 and {MAX_PAGE_SIZE}.")
+    total = combination_count(len(population), size)
+    end = min(total, offset + limit)
+    cached = cached_full_model(population, size, properties)
+    if cached is not None:
+        models = cached[offset:end]
+    else:
+        models = build_combination_models(
+            list(iter_combination_range(population, size, offset, limit)),
+            start_index=offset + 1,
+            population_size=len(population),
+            properties=properties,
+        )
+    return models, (end if end < total else None)
+
+
+def generate_random_combinations(
+    population, size, amount=1, start_index=1, properties=None
+):
     """Generate multiple random combinations (with possible duplicates) of a given size from a population.
     Args:
         population (list): The population from which to generate combinations.
         size (int): The size of each combination.
         amount (int): The number of combinations to generate.
+        properties (list[str]): Properties to compute; None computes all of them.
     Returns:
-        list: A list of tuples, each representing a random combination.
+        CombinationStore: The enriched random combinations.
     """
     try:
         result = build_combination_models(
             [tuple(sorted(random.sample(population, size))) for _ in range(amount)],
             start_index=start_index,
             population_size=len(population),
+            properties=properties,
         )
     except Exception as e:
         raise RuntimeError(f"Error generating random combinations: {e}")
@@ -47,53 +201,101 @@ def generate_random_combinations(population, size, amount=1, start_index=1):
         return result
 
 
-def generate_random_unique_combinations(population, size, amount=1, start_index=1):
+def generate_random_unique_combinations(
+    population, size, amount=1, start_index=1, properties=None
+):
     """Generate multiple unique random combinations of a given size from a population.
     Args:
         population (list): The population from which to generate combinations.
         size (int): The size of each combination.
         amount (int): The number of unique combinations to generate.
+        properties (list[str]): Properties to compute; None computes all of them.
+    Raises:
+        ValueError: If amount is not an integer between 0 and C(n,k).
     """
-    comb_set = set()
-    while len(comb_set) < amount:
-        comb = tuple(sorted(random.sample(population, size)))
-        comb_set.add(comb)
+    total = combination_count(len(population), size)
+    if (
+        isinstance(amount, bool)
+        or not isinstance(amount, int)
+        or not 0 <= amount <= total
+    ):
+        raise ValueError(
+            f"amount must be an integer between 0 and {total}, the number of unique "
+            f"combinations of {size} members from {len(population)}."
+        )
+    # Draw unique ranks instead of rejection-sampling combinations, so the cost
+    # stays O(amount * k) even when amount approaches C(n,k).
+    ranks = random.sample(range(total), amount)
+    comb_set = [combination_at(rank, population, size) for rank in ranks]
     try:
         comb_set = build_combination_models(
-            comb_set, start_index=start_index, population_size=len(population)
+            comb_set,
+            start_index=start_index,
+            population_size=len(population),
+            properties=properties,
         )
     except Exception as e:
         raise RuntimeError(f"Error serializing unique random combinations: {e}")
     finally:
-        return list(comb_set)
+        return comb_set
 
 
-def build_combination_models(combinations, start_index=1, population_size=None):
+def build_combination_models(
+    combinations, start_index=1, population_size=None, properties=None
+):
     """
-    Converts raw combinations into CombinationModel instances with calculated properties.
+    Converts raw combinations into an array-backed CombinationStore with calculated properties.
 
     Args:
     combinations (Iterable[tuple]): The list or set of raw combinations.
+    properties (Iterable[str]): Registered properties to compute; None computes all of them.
 
     Returns:
-    list[dict]: List of dictionaries representing enriched CombinationModels.
+    CombinationStore: The enriched models; rows are read-only views that export
+    to the same dicts CombinationModel.to_dict produced.
     """
-    prop_functions = [
-        level_key,
-        level_members,
-        sequence_key,
-        prime_count,
-        generate_boxes,
-    ]
-    models = []
     try:
-        for index, combination in enumerate(combinations, start=start_index):
-            model = CombinationModel(combination, index)
-            model.calculate_properties(
-                prop_functions, population_size=population_size, index=index
+        if not isinstance(combinations, (list, np.ndarray)):
+            combinations = list(combinations)
+        # Selected properties with a batch implementation are computed for the whole
+        # batch at once; the others are derived from the numbers when a row is exported.
+        with stage("batch_properties", rows=len(combinations)):
+            models = CombinationStore.from_combinations(
+                combinations, start_index, population_size, properties
             )
-            models.append(model.to_dict())
     except Exception as e:
         # Handle serialization errors
         raise RuntimeError(f"Error serializing combination models: {e}")
     return models
+
+
+def iter_combination_models(
+    combinations,
+    start_index=1,
+    population_size=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    properties=None,
+):
+    """
+    Lazily converts raw combinations into enriched models, one chunk at a time.
+
+    Args:
+    combinations (Iterable[tuple]): Any iterable of raw combinations, consumed lazily.
+    chunk_size (int): The number of models built per chunk.
+
+    Yields:
+    CombinationStore: Chunks of enriched models with contiguous indexes.
+    """
+    iterator = iter(combinations)
+    index = start_index
+    while True:
+        batch = list(islice(iterator, chunk_size))
+        if not batch:
+            return
+        yield build_combination_models(
+            batch,
+            start_index=index,
+            population_size=population_size,
+            properties=properties,
+        )
+        index += len(batch)
@@ -0,0 +1,97 @@
+from bisect import bisect_right
+from math import comb
+
+
+def combination_count(population_size, size):
+    """Return C(n, k), the number of combinations of a given size."""
+    return comb(population_size, size)
+
+
+def rank_combination(positions, population_size):
+    """Return the lexicographic rank of a combination of positions.
+    Ranks follow the order produced by itertools.combinations(range(n), k).
+    Args:
+        positions (Sequence[int]): Strictly increasing 0-based positions in the population.
+        population_size (int): n, the number of members in the population.
+    Returns:
+        int: The 0-based rank in [0, C(n, k)).
+    """
+    size = len(positions)
+    total = comb(population_size, size)
+    colex = sum(
+        comb(population_size - 1 - p, size - i) for i, p in enumerate(positions)
+    )
+    return total - 1 - colex
+
+
+def _largest_with_comb_at_most(value, r, upper):
+    """Largest x < upper with C(x, r) <= value (C is increasing in x for x >= r)."""
+    # bisect over the virtual sorted sequence C(0, r), C(1, r), ... C(upper - 1, r)
+    return bisect_right(range(upper), value, key=lambda x: comb(x, r)) - 1
+
+
+def unrank_combination(rank, population_size, size):
+    """Return the combination of positions with the given lexicographic rank.
+    Args:
+        rank (int): The 0-based rank in [0, C(n, k)).
+        population_size (int): n, the number of members in the population.
+        size (int): k, the number of members in each combination.
+    Returns:
+        tuple[int]: Strictly increasing 0-based positions.
+    """
+    total = comb(population_size, size)
+    if not 0 <= rank < total:
+        raise ValueError(
+            f"Rank {rank} is out of range for C({population_size},{size})."
+        )
+    remaining = total - 1 - rank
+    upper = population_size
+    positions = []
+    for i in range(size):
+        x = _largest_with_comb_at_most(remaining, size - i, upper)
+        positions.append(population_size - 1 - x)
+        remaining -= comb(x, size - i)
+        upper = x
+    return tuple(positions)
+
+
+def rank_of(combination, population):
+    """Return the lexicographic rank of a combination of population members.
+    The order is the one itertools.combinations(population, k) produces.
+    """
+    position = {member: i for i, member in enumerate(population)}
+    positions = sorted(position[member] for member in combination)
+    return rank_combination(positions, len(population))
+
+
+def combination_at(rank, population, size):
+    """Return the combination of population members at a lexicographic rank."""
+    return tuple(population[p] for p in unrank_combination(rank, len(population), size))
+
+
+def iter_combination_range(population, size, start_rank=0, count=None):
+    """Yield combinations in lexicographic order starting at start_rank.
+    Only the first combination is unranked; the rest are produced by the
+    usual successor step, so any slice of the universe costs O(k) per row.
+    Args:
+        population (list): The population from which to generate combinations.
+        size (int): The size of each combination.
+        start_rank (int): The rank of the first combination to yield.
+        count (int): How many combinations to yield; defaults to the end of the universe.
+    """
+    n = len(population)
+    total = comb(n, size)
+    end = total if count is None else min(total, start_rank + count)
+    if start_rank >= end:
+        return
+    positions = list(unrank_combination(start_rank, n, size))
+    for _ in range(end - start_rank):
+        yield tuple(population[p] for p in positions)
+        i = size - 1
+        while i >= 0 and positions[i] == n - size + i:
+            i -= 1
+        if i < 0:
+            return
+        positions[i] += 1
+        for j in range(i + 1, size):
+            positions[j] = positions[j - 1] + 1
@@ -1,6 +1,12 @@
 from collections import defaultdict, Counter
-from typing import Any, Optional
-import statistics
+from fractions import Fraction
+from itertools import compress
+from typing import Any
+import math
+import numpy as np
+from utils.combinBatchProperties import decimal_label
+from utils.requestMetrics import stage
+from utils.filterCompiler import compile_filter, evaluate_filters
 
 
 def level_key(combination, population_size=28):
@@ -13,7 +19,6 @@ def level_key(combination, population_size=28):
     Returns:
         tuple: A tuple containing the key name and the level key as a string.
     """
-
     levels = [0] * ((population_size // 10) + 1)
     for n in combination:
         if 1 <= n <= population_size:
@@ -31,7 +36,6 @@ def level_members(combination, population_size=28):
     Returns:
         tuple: A tuple containing the key name and a list of dictionaries with level members.
     """
-
     levels = {f"LkM{str(i+1).zfill(2)}": [] for i in range((population_size // 10) + 1)}
     for n in combination:
         if 1 <= n <= population_size:
@@ -78,6 +82,56 @@ def prime_count(combination):
     return "prime_count", str(prime_count)
 
 
+def _sorted_members(combination):
+    return sorted(combination)
+
+
+def _gaps(combination):
+    members = _sorted_members(combination)
+    return [b - a for a, b in zip(members, members[1:])]
+
+
+def gap_variance(combination):
+    """Gaps between the sorted members of a combination.
+    Returns:
+        tuple: The key name and the gaps as a string, e.g. "2-10-5-8" for 1,3,13,18,26.
+    """
+    return "gap_variance", "-".join(map(str, _gaps(combination)))
+
+
+def max_gap(combination):
+    """Largest gap between the sorted members of a combination, as a string."""
+    return "max_gap", str(max(_gaps(combination), default=0))
+
+
+def avg_gap(combination):
+    """Average gap between the sorted members of a combination, as a string."""
+    members = _sorted_members(combination)
+    k = len(members)
+    return "avg_gap", decimal_label(
+        (members[-1] - members[0]) / (k - 1) if k > 1 else 0
+    )
+
+
+def arith_total(combination):
+    """Sum of the members of a combination, as a string."""
+    return "arith_total", str(sum(_sorted_members(combination)))
+
+
+def arith_avg(combination):
+    """Average of the members of a combination, as a string."""
+    members = _sorted_members(combination)
+    return "arith_avg", decimal_label(sum(members) / len(members))
+
+
+def arith_std(combination):
+    """Population standard deviation of the members of a combination, as a string."""
+    members = _sorted_members(combination)
+    k = len(members)
+    spread = k * sum(n * n for n in members) - sum(members) ** 2
+    return "arith_std", decimal_label(math.sqrt(spread) / k)
+
+
 def generate_boxes(combination, cIndex):
     box_configs = [
         {"size": 10, "id": 100},
@@ -101,79 +155,230 @@ def generate_boxes(combination, cIndex):
     return "boxes", boxes
 
 
-def calc_deltas(indexes):
-    return [j - i for i, j in zip(indexes[:-1], indexes[1:])]
+def apply_filter(combination, filter_string):
+    """Tests one combination against a filter string (see utils.filterCompiler)."""
+    return compile_filter(filter_string)(combination)
+
 
+def filter_keys(filters_list):
+    """Returns the combination keys referenced by a list of filter strings."""
+    keys = []
+    for filter_string in filters_list:
+        for clause in compile_filter(filter_string).clauses:
+            if clause.key not in keys:
+                keys.append(clause.key)
+    return keys
 
-def apply_filter(combination, filter_string):
-    if filter_string == "all":
-        return True
-    for clause in filter_string.split("&"):
-        if "=" not in clause:
-            raise ValueError(
-                f"Invalid filter clause: {clause}. Expected format 'key=value'."
-            )
-        k, v = clause.split("=")
-        if str(combination.get(k)) != v:
-            return False
-    return True
-
-
-def top3_frequent_deltas(deltas):
-    """Returns the top 3 most frequent deltas."""
-    if not deltas:
-        return []
-    freq = Counter(deltas)
+
+def numbers_matrix(combinations):
+    """
+    Stacks the numbers of every combination into an (N, k) array, or returns
+    None when they are ragged or hold repeated members.
+    """
+    if isinstance(getattr(combinations, "numbers", None), np.ndarray):
+        # array-backed stores already hold the (N, k) matrix
+        numbers = combinations.numbers.astype(np.int64)
+    else:
+        try:
+            numbers = np.asarray([c.get("numbers", []) for c in combinations], np.int64)
+        except ValueError:
+            return None
+    if numbers.ndim != 2:
+        return None
+    ordered = np.sort(numbers, axis=1)
+    if (ordered[:, 1:] == ordered[:, :-1]).any():
+        return None
+    return numbers
+
+
+def member_positions(combinations, filter_str, mask=None, numbers=None):
+    """
+    Builds an inverted index in a single pass over the combinations.
+    Args:
+        mask (numpy.ndarray): Precomputed boolean mask of filter_str, e.g. from
+            evaluate_filters; computed here when omitted.
+        numbers (numpy.ndarray): Optional numbers_matrix of the combinations;
+            when given the index is built with array operations.
+    Returns:
+        tuple: member -> dynamic indexes (1-based positions among the filtered
+        combinations) of the combinations holding it, and the filtered count.
+    """
+    if mask is None:
+        mask = evaluate_filters(combinations, [filter_str])[0]
+
+    if numbers is not None:
+        filtered = numbers[mask]
+        matched = len(filtered)
+        members = filtered.ravel()
+        dyn_index = np.repeat(np.arange(1, matched + 1), filtered.shape[1])
+        order = np.argsort(members, kind="stable")
+        members, dyn_index = members[order], dyn_index[order]
+        unique, starts = np.unique(members, return_index=True)
+        return dict(zip(unique.tolist(), np.split(dyn_index, starts[1:]))), matched
+
+    positions = defaultdict(list)
+    matched = 0
+    for c in compress(combinations, mask):
+        matched += 1
+        for n in set(c.get("numbers", [])):
+            positions[n].append(matched)
+    return positions, matched
+
+
+def delta_aggregates(deltas):
+    """Count, sum, sum of squares, min, max and frequency table of a delta array."""
+    if not len(deltas):
+        return 0, 0, 0, None, None, {}
+    values, counts = np.unique(deltas, return_counts=True)
+    return (
+        len(deltas),
+        int(deltas.sum()),
+        int((deltas * deltas).sum()),
+        int(values[0]),
+        int(values[-1]),
+        dict(zip(values.tolist(), counts.tolist())),
+    )
+
+
+def speed_summary(filter_str, count, total, total_sq, minimum, maximum, freq):
+    """
+    Builds the speed metrics of one key member under one filter from delta
+    aggregates. Integer sums keep mean and variance exact, so values and types
+    match statistics.mean and statistics.stdev over the deltas.
+    """
+    if count:
+        mean = total // count if total % count == 0 else total / count
+    if count > 1:
+        variance = Fraction(count * total_sq - total * total, count * (count - 1))
     # sort by frequency descending, then by value ascending
     most_common = sorted(freq.items(), key=lambda x: (-x[1], x[0]))
-    return [val for val, _ in most_common[:3]]
+    return {
+        "filter": filter_str,
+        "speed(avg)": round(mean, 2) if count else 0,
+        "speed(min)": minimum if count else 0,
+        "speed(max)": maximum if count else 0,
+        "speed(stddev)": round(math.sqrt(variance), 2) if count > 1 else 0,
+        "speed(top3)": [val for val, _ in most_common[:3]],
+    }
+
+
+def normalize_windows(windows):
+    """Validates rolling window sizes and returns them sorted and deduplicated.
+    Raises:
+        ValueError: If a window is not a positive integer.
+    """
+    if not windows:
+        return ()
+    if isinstance(windows, int):
+        windows = [windows]
+    if any(isinstance(w, bool) or not isinstance(w, int) or w < 1 for w in windows):
+        raise ValueError("windows must be positive integers.")
+    return tuple(sorted(set(windows)))
+
+
+def window_cutoffs(mask, windows):
+    """
+    Number of filtered combinations before each window, so that the filtered
+    combinations of the window of the last w rows are the dynamic indexes above it.
+    """
+    matched_before = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+    rows = len(mask)
+    return {w: int(matched_before[max(rows - w, 0)]) for w in windows}
+
+
+def windowed_speed_summaries(filter_str, dyn_index, cutoffs):
+    """
+    Speed metrics of one key member over several rolling windows in one pass.
+    The deltas of a window are a suffix of the whole-history deltas (those
+    between dynamic indexes above its cutoff), so counts, sums and sums of
+    squares come from prefix sums, min and max from suffix minima and maxima,
+    and the frequency table grows from the smallest window to the largest,
+    visiting every delta of the largest window once.
+    Args:
+        dyn_index (numpy.ndarray): Sorted dynamic indexes of the member.
+        cutoffs (dict[int, int]): Window size -> number of filtered combinations before it.
+    Returns:
+        dict[int, dict]: Window size -> speed_summary of its deltas, plus "window".
+    """
+    deltas = np.diff(dyn_index)
+    sums = np.concatenate(([0], np.cumsum(deltas)))
+    squares = np.concatenate(([0], np.cumsum(deltas * deltas)))
+    suffix_min = np.minimum.accumulate(deltas[::-1])[::-1]
+    suffix_max = np.maximum.accumulate(deltas[::-1])[::-1]
+
+    summaries = {}
+    freq = Counter()
+    covered = len(deltas)
+    # the smallest window has the latest start, so each window extends the previous one
+    for window in sorted(cutoffs):
+        start = min(int(np.searchsorted(dyn_index, cutoffs[window], "right")), covered)
+        values, counts = np.unique(deltas[start:covered], return_counts=True)
+        freq.update(dict(zip(values.tolist(), counts.tolist())))
+        covered = start
+        count = len(deltas) - start
+        summaries[window] = {
+            **speed_summary(
+                filter_str,
+                count,
+                int(sums[-1] - sums[start]),
+                int(squares[-1] - squares[start]),
+                int(suffix_min[start]) if count else None,
+                int(suffix_max[start]) if count else None,
+                freq,
+            ),
+            "window": window,
+        }
+    return summaries
+
+
+def refresh_analytics(combinations, key_members, filters_list, windows=None):
+    with stage("analytics", rows=len(combinations)):
+        return _refresh_analytics(combinations, key_members, filters_list, windows)
+
+
+def refresh_windowed_analytics(combinations, key_members, filters_list, windows):
+    """
+    Only the rolling-window metrics (general_wN, filter_XX_wN) of refresh_analytics.
+    Deltas inside a window do not depend on earlier rows, so combinations may be
+    just the last max(windows) rows of the model.
+    """
+    with stage("analytics", rows=len(combinations)):
+        return _refresh_analytics(
+            combinations, key_members, filters_list, windows, whole_history=False
+        )
+
 
+def _refresh_analytics(
+    combinations, key_members, filters_list, windows=None, whole_history=True
+):
 
-def refresh_analytics(combinations, key_members, filters_list):
+    # initialize results, keyed by member for constant-time lookup
+    results: dict[str, dict[str, Any]] = {}
+    windows = normalize_windows(windows)
 
-    # initialize results
-    resuts: list[dict[str, Any]] = []
+    # every filter is compiled once; clauses shared between filters run once
+    masks = evaluate_filters(combinations, filters_list)
+    numbers = numbers_matrix(combinations)
 
-    for filter_index, filter_str in enumerate(filters_list):
+    for filter_index, (filter_str, mask) in enumerate(zip(filters_list, masks)):
 
-        # appy filter
-        filtered_combs = [c for c in combinations if apply_filter(c, filter_str)]
+        # one pass per filter: member -> dynamic indexes
+        positions, _ = member_positions(combinations, filter_str, mask, numbers)
 
-        # assing dynamic inndex to filtered combinations
-        for i, c in enumerate(filtered_combs):
-            c["_dyn_index"] = i + 1
+        metric_key = "general" if filter_str == "all" else f"filter_{filter_index:02d}"
+        cutoffs = window_cutoffs(mask, windows)
 
-        # find matching combos for each key member
         for key_member in key_members:
-            member = int(
-                key_member
-            )  # note: make this flexible to accept both int and str
-            matching_combos = [
-                c for c in filtered_combs if member in c.get("numbers", [])
-            ]  # note: use get to avoid KeyError
-            dyn_index = [c["_dyn_index"] for c in matching_combos]
-            deltas = calc_deltas(dyn_index)
-
-            # find or create result entry for this key member
-            key_result: Optional[dict[str, Any]] = next(
-                (r for r in resuts if r["key"] == str(key_member)), None
-            )
-            if not key_result:
-                key_result: Optional[dict[str, Any]] = {"key": str(key_member)}
-                resuts.append(key_result)
-
-            metric_key = (
-                "general" if filter_str == "all" else f"filter_{filter_index:02d}"
-            )
-
-            key_result[metric_key] = {
-                "filter": filter_str,
-                "speed(avg)": round(statistics.mean(deltas), 2) if deltas else 0,
-                "speed(min)": min(deltas) if deltas else 0,
-                "speed(max)": max(deltas) if deltas else 0,
-                "speed(stddev)": (
-                    round(statistics.stdev(deltas), 2) if len(deltas) > 1 else 0
-                ),
-                "speed(top3)": top3_frequent_deltas(deltas),
-            }
-    return resuts
+            member = int(key_member)
+            dyn_index = np.asarray(positions.get(member, ()), dtype=np.int64)
+
+            key_result = results.setdefault(str(key_member), {"key": str(key_member)})
+            if whole_history:
+                key_result[metric_key] = speed_summary(
+                    filter_str, *delta_aggregates(np.diff(dyn_index))
+                )
+            if windows:
+                windowed = windowed_speed_summaries(filter_str, dyn_index, cutoffs)
+                for window, summary in windowed.items():
+                    key_result[f"{metric_key}_w{window}"] = summary
+    return list(results.values())
@@ -1,4 +1,9 @@
+from utils.propertyRegistry import PROPERTY_REGISTRY, definition_for
+
+
 class CombinationModel:
+    __slots__ = ("index", "numbers", "properties")
+
     def __init__(self, numbers, index):
         """Initializes the CombinationModel with a list of numbers and an index.
         :param numbers: List of numbers to be used in the model."""
@@ -8,20 +13,24 @@ class CombinationModel:
 
     def calculate_properties(self, properties_functions, **kwargs):
         """Calculates properties of the numbers using provided functions.
-        :param properties_functions: List of functions that take a list of numbers and return a key-value pair.
+        :param properties_functions: Registered property functions, or property names.
+        :param population_size: Population size, for properties that declare it as context.
+        :param index: Index of the combination, for properties that declare it as context.
         """
+        population_size = kwargs.get("population_size") or 28
+        index = kwargs.get("index", self.index)
         for func in properties_functions:
-            if (
-                func.__name__ in ("level_key", "level_members")
-                and "population_size" in kwargs
-            ):
-                key, value = func(
-                    self.numbers, population_size=kwargs["population_size"]
-                )
-            elif func.__name__ == "generate_boxes" and "index" in kwargs:
-                key, value = func(self.numbers, kwargs["index"])
-            else:
+            definition = (
+                PROPERTY_REGISTRY[func]
+                if isinstance(func, str)
+                else definition_for(func)
+            )
+            if definition is None:
+                # unregistered functions are called with the numbers only
                 key, value = func(self.numbers)
+            else:
+                key = definition.name
+                value = definition.compute(self.numbers, index, population_size)
             self.properties[key] = value
 
     def to_dict(self):
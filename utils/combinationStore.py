@@ -0,0 +1,241 @@
+from collections.abc import Mapping
+import numpy as np
+from utils.combinBatchProperties import as_combination_array
+from utils.propertyRegistry import PROPERTY_REGISTRY, resolve_properties
+
+# Keys every exported row starts with, before its properties.
+BASE_KEYS = ("index", "numbers")
+
+
+def _smallest_unsigned(array):
+    """Casts a non-negative integer array to the smallest unsigned dtype holding it."""
+    if not array.size or array.min() < 0:
+        return array
+    return array.astype(np.min_scalar_type(int(array.max())), copy=False)
+
+
+class CombinationRow(Mapping):
+    """Read-only view of one row of a CombinationStore; values are built on access."""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._store.value(self._row, key)
+
+    def __iter__(self):
+        return iter(self._store.keys)
+
+    def __len__(self):
+        return len(self._store.keys)
+
+    def __repr__(self):
+        return f"CombinationRow({self.to_dict()!r})"
+
+    def to_dict(self):
+        """The row as the plain dict written to JSON."""
+        return self._store.row_dict(self._row)
+
+
+class CombinationStore:
+    """
+    Batch of enriched combinations held column-wise: the numbers in one
+    contiguous (N, k) integer array, properties with a batch implementation
+    (level_key, sequence_key, prime_count and the gap and arithmetic group)
+    as dictionary codes, and the other selected properties (level_members,
+    boxes) derived on access.
+    Indexing and iteration return lazy CombinationRow views and slicing
+    returns a store sharing the same arrays; plain dicts are only built when
+    rows are exported (to_dicts, json_default).
+    """
+
+    __slots__ = ("numbers", "start_index", "population_size", "properties", "_columns")
+
+    def __init__(
+        self,
+        numbers,
+        start_index=1,
+        population_size=28,
+        columns=None,
+        properties=None,
+    ):
+        self.numbers = numbers
+        self.start_index = start_index
+        self.population_size = population_size
+        self.properties = resolve_properties(properties)
+        self._columns = columns or {}
+
+    @classmethod
+    def from_combinations(
+        cls, combinations, start_index=1, population_size=None, properties=None
+    ):
+        """Builds a store from raw combinations, computing the batch property columns.
+        Args:
+            combinations (Iterable[Iterable[int]] | numpy.ndarray): The raw
+                combinations, or an (N, k) array already sorted along its rows.
+            start_index (int): The index of the first combination.
+            population_size (int): The maximum number of population used to build combinations.
+            properties (Iterable[str]): Property selection; None selects every registered property.
+        """
+        population_size = population_size if population_size is not None else 28
+        properties = resolve_properties(properties)
+        if not isinstance(combinations, (list, np.ndarray)):
+            combinations = list(combinations)
+        if not len(combinations):
+            return cls(
+                np.empty((0, 0), np.uint8),
+                start_index,
+                population_size,
+                properties=properties,
+            )
+        if isinstance(combinations, np.ndarray):
+            arr = combinations
+        else:
+            arr = as_combination_array(combinations)
+        columns = {}
+        # group encoder -> its columns, so each group is encoded once per store
+        groups = {}
+        for name in properties:
+            definition = PROPERTY_REGISTRY[name]
+            if definition.group is not None:
+                if definition.group not in groups:
+                    groups[definition.group] = definition.group(arr, population_size)
+                labels, codes = groups[definition.group][name]
+            elif definition.encode is not None:
+                labels, codes = definition.encode(arr, population_size)
+            else:
+                continue
+            columns[name] = (labels, _smallest_unsigned(codes))
+        return cls(
+            _smallest_unsigned(arr), start_index, population_size, columns, properties
+        )
+
+    @property
+    def keys(self):
+        """Keys of the exported rows, in order."""
+        return BASE_KEYS + self.properties
+
+    def select(self, properties):
+        """A store over the same arrays exporting only the given properties."""
+        properties = resolve_properties(properties)
+        missing = [name for name in properties if name not in self.properties]
+        if missing:
+            raise ValueError(f"Properties not available in this store: {missing}.")
+        return CombinationStore(
+            self.numbers,
+            self.start_index,
+            self.population_size,
+            {k: v for k, v in self._columns.items() if k in properties},
+            properties,
+        )
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                raise ValueError("CombinationStore slices must be contiguous.")
+            stop = max(start, stop)
+            return CombinationStore(
+                self.numbers[start:stop],
+                self.start_index + start,
+                self.population_size,
+                {
+                    k: (labels, codes[start:stop])
+                    for k, (labels, codes) in self._columns.items()
+                },
+                self.properties,
+            )
+        row = range(len(self))[item]
+        return CombinationRow(self, row)
+
+    def __iter__(self):
+        return (CombinationRow(self, row) for row in range(len(self)))
+
+    def __eq__(self, other):
+        """Row-wise equality with another store or a sequence of row dicts."""
+        if not isinstance(other, (CombinationStore, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the arrays and dictionaries of the store."""
+        total = self.numbers.nbytes
+        for labels, codes in self._columns.values():
+            total += codes.nbytes + sum(len(label) + 49 for label in labels)
+        return total
+
+    def value(self, row, key):
+        """The value of one key of one row, as it appears in the exported dict."""
+        if key == "index":
+            return self.start_index + row
+        if key == "numbers":
+            return self.numbers[row].tolist()
+        if key in self._columns:
+            labels, codes = self._columns[key]
+            return labels[codes[row]]
+        if key in self.properties:
+            return PROPERTY_REGISTRY[key].compute(
+                self.numbers[row].tolist(), self.start_index + row, self.population_size
+            )
+        raise KeyError(key)
+
+    def row_dict(self, row):
+        """One row as a plain dict, keys in the order of keys."""
+        index = self.start_index + row
+        numbers = self.numbers[row].tolist()
+        result = {"index": index, "numbers": numbers}
+        for key in self.properties:
+            if key in self._columns:
+                labels, codes = self._columns[key]
+                result[key] = labels[codes[row]]
+            else:
+                result[key] = PROPERTY_REGISTRY[key].compute(
+                    numbers, index, self.population_size
+                )
+        return result
+
+    def to_dicts(self):
+        """Exports every row as a plain dict."""
+        return [self.row_dict(row) for row in range(len(self))]
+
+    def dictionary_column(self, key):
+        """(labels, per-row codes) of a dictionary-encoded column, or None for other keys."""
+        return self._columns.get(key)
+
+    def encoded_column(self, key):
+        """
+        A column as (distinct values as strings, per-row codes), the form
+        utils.filterCompiler.evaluate_filters builds its masks from.
+        """
+        if key in self._columns:
+            labels, codes = self._columns[key]
+            return list(labels), codes
+        lookup = {}
+        values = (
+            str(self.value(row, key)) if key in self.keys else "None"
+            for row in range(len(self))
+        )
+        codes = np.fromiter(
+            (lookup.setdefault(value, len(lookup)) for value in values),
+            dtype=np.int64,
+            count=len(self),
+        )
+        return list(lookup), codes
+
+
+def json_default(value):
+    """json.dumps default hook exporting stores and row views at the serialization boundary."""
+    if isinstance(value, CombinationRow):
+        return value.to_dict()
+    if isinstance(value, CombinationStore):
+        return value.to_dicts()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,198 @@
+import re
+from functools import lru_cache
+import numpy as np
+
+# Filter language, parsed once per distinct filter string:
+#   filter  := "all" | group ("|" group)*      groups are ORed
+#   group   := clause ("&" clause)*            clauses are ANDed
+#   clause  := key "=" value | key "!=" value
+#            | key ("<" | "<=" | ">" | ">=") number
+#            | key "=" number ".." number      inclusive numeric range
+#            | key ["not"] "in" "(" value ("," value)* ")"
+# Values compare against str(combination[key]), as the original key=value
+# filters did; numeric operators compare float(combination[key]).
+_CLAUSE = re.compile(
+    r"^\s*(?P<key>[^\s!=<>()]+)\s*(?:"
+    r"(?P<op>!=|>=|<=|=|>|<)\s*(?P<value>.*?)"
+    r"|\s(?P<negate>not\s+)?in\s*\((?P<items>.*)\)"
+    r")\s*$"
+)
+_RANGE = re.compile(r"^(?P<low>-?\d+(?:\.\d+)?)\.\.(?P<high>-?\d+(?:\.\d+)?)$")
+
+
+def _as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Clause:
+    """A single parsed comparison against one combination key."""
+
+    __slots__ = ("key", "op", "operand")
+
+    def __init__(self, key, op, operand):
+        self.key = key
+        self.op = op
+        self.operand = operand
+
+    @property
+    def identity(self):
+        """Hashable identity; equal clauses across filters are evaluated once."""
+        return self.key, self.op, self.operand
+
+    def test(self, value):
+        """Tests the string form of a combination value."""
+        op, operand = self.op, self.operand
+        if op == "=":
+            return value == operand
+        if op == "!=":
+            return value != operand
+        if op == "in":
+            return value in operand
+        if op == "not in":
+            return value not in operand
+        number = _as_number(value)
+        if number is None:
+            return False
+        if op == "range":
+            return operand[0] <= number <= operand[1]
+        if op == "<":
+            return number < operand
+        if op == "<=":
+            return number <= operand
+        if op == ">":
+            return number > operand
+        return number >= operand
+
+
+def parse_clause(text):
+    """Parses one clause of a filter string into a Clause."""
+    match = _CLAUSE.match(text)
+    if not match or (match["op"] and match["value"] == "" and match["op"] != "="):
+        raise ValueError(f"Invalid filter clause: {text}. Expected format 'key=value'.")
+    key = match["key"]
+    if match["items"] is not None:
+        items = frozenset(item.strip() for item in match["items"].split(","))
+        return Clause(key, "not in" if match["negate"] else "in", items)
+
+    op, value = match["op"], match["value"]
+    numeric_range = _RANGE.match(value) if op == "=" else None
+    if numeric_range:
+        low, high = float(numeric_range["low"]), float(numeric_range["high"])
+        return Clause(key, "range", (low, high))
+    if op in ("=", "!="):
+        return Clause(key, op, value)
+    number = _as_number(value)
+    if number is None:
+        raise ValueError(f"Invalid filter clause: {text}. '{op}' expects a number.")
+    return Clause(key, op, number)
+
+
+class CompiledFilter:
+    """A filter string parsed into OR groups of AND clauses."""
+
+    __slots__ = ("text", "groups")
+
+    def __init__(self, text, groups):
+        self.text = text
+        self.groups = groups
+
+    @property
+    def clauses(self):
+        return [clause for group in self.groups for clause in group]
+
+    def __call__(self, combination):
+        if not self.groups:
+            return True
+        return any(
+            all(clause.test(str(combination.get(clause.key))) for clause in group)
+            for group in self.groups
+        )
+
+
+@lru_cache(maxsize=1024)
+def compile_filter(filter_string):
+    """Parses a filter string once; "all" compiles to a filter matching everything."""
+    if filter_string == "all":
+        return CompiledFilter(filter_string, ())
+    groups = tuple(
+        tuple(parse_clause(clause) for clause in group.split("&"))
+        for group in filter_string.split("|")
+    )
+    return CompiledFilter(filter_string, groups)
+
+
+def compile_filters(filters_list):
+    """Compiles every filter of a filtersList.
+    Raises:
+        ValueError: If filters_list is not a list of valid filter strings.
+    """
+    if not isinstance(filters_list, list) or not all(
+        isinstance(filter_string, str) for filter_string in filters_list
+    ):
+        raise ValueError("filtersList must be a list of filter strings.")
+    return [compile_filter(filter_string) for filter_string in filters_list]
+
+
+def _rows_column(rows, key):
+    """Dictionary-encodes str(row[key]) over a list of rows."""
+    lookup = {}
+    codes = np.fromiter(
+        (lookup.setdefault(str(row.get(key)), len(lookup)) for row in rows),
+        dtype=np.int64,
+        count=len(rows),
+    )
+    return list(lookup), codes
+
+
+def evaluate_filters(source, filters_list):
+    """
+    Evaluates every filter of filters_list over a model as boolean row masks.
+    Each key is dictionary-encoded once, each distinct clause is tested once
+    per distinct value, and clauses repeated across filters are shared.
+    Args:
+        source: A list of combination dicts, or a ColumnarModel whose
+            dictionary-encoded columns are used directly.
+    Returns:
+        list[numpy.ndarray]: One boolean mask per filter.
+    """
+    row_count = len(source)
+    columns = {}
+    clause_masks = {}
+    filter_masks = {}
+
+    def column(key):
+        if key not in columns:
+            if hasattr(source, "encoded_column"):
+                columns[key] = source.encoded_column(key)
+            else:
+                columns[key] = _rows_column(source, key)
+        return columns[key]
+
+    def clause_mask(clause):
+        if clause.identity not in clause_masks:
+            labels, codes = column(clause.key)
+            matches = np.fromiter(
+                (clause.test(label) for label in labels), dtype=bool, count=len(labels)
+            )
+            clause_masks[clause.identity] = matches[codes]
+        return clause_masks[clause.identity]
+
+    results = []
+    for filter_string in filters_list:
+        if filter_string not in filter_masks:
+            compiled = compile_filter(filter_string)
+            if not compiled.groups:
+                mask = np.ones(row_count, dtype=bool)
+            else:
+                mask = np.zeros(row_count, dtype=bool)
+                for group in compiled.groups:
+                    group_mask = np.ones(row_count, dtype=bool)
+                    for clause in group:
+                        group_mask &= clause_mask(clause)
+                    mask |= group_mask
+            filter_masks[filter_string] = mask
+        results.append(filter_masks[filter_string])
+    return results
@@ -0,0 +1,133 @@
+from typing import Any
+import numpy as np
+from utils.combinPropertiesFunctions import (
+    delta_aggregates,
+    filter_keys,
+    member_positions,
+    numbers_matrix,
+    speed_summary,
+)
+from utils.filterCompiler import evaluate_filters
+from utils.requestMetrics import stage
+
+# Persisted analytics state, one entry per filter and key member:
+#   last     -> dynamic index of the last filtered combination holding the member
+#   count    -> number of deltas seen
+#   total    -> sum of deltas
+#   total_sq -> sum of squared deltas
+#   min/max  -> extreme deltas
+#   freq     -> delta -> occurrences (keys are strings, as stored in JSON)
+# Summaries are rendered with speed_summary, exactly like refresh_analytics.
+# "windows" lists the rolling windows rendered next to the whole-history
+# metrics; they are recomputed from "recent", the last max(windows) rows
+# (numbers and filtered columns only), which appends extend in the state.
+
+
+def new_analytics_state(key_members, filters_list, windows=()):
+    """Creates an empty analytics state for the given key members and filters."""
+    return {
+        "key_members": [str(m) for m in key_members],
+        "filters_list": list(filters_list),
+        "windows": list(windows),
+        "recent": [],
+        "row_count": 0,
+        "filters": [
+            {
+                "matched": 0,
+                "members": {str(m): _new_member_state() for m in key_members},
+            }
+            for _ in filters_list
+        ],
+    }
+
+
+def state_matches(state, key_members, filters_list):
+    """True when a persisted state was built for the same key members and filters."""
+    same_members = state["key_members"] == [str(m) for m in key_members]
+    return same_members and state["filters_list"] == list(filters_list)
+
+
+def recent_rows(state, rows):
+    """Rows as kept in the state's "recent" list: numbers and filtered columns only."""
+    keys = ["numbers", *filter_keys(state["filters_list"])]
+    return [{key: row[key] for key in keys if key in row} for row in rows]
+
+
+def _new_member_state():
+    return {
+        "last": None,
+        "count": 0,
+        "total": 0,
+        "total_sq": 0,
+        "min": None,
+        "max": None,
+        "freq": {},
+    }
+
+
+def _record_deltas(member_state, deltas):
+    count, total, total_sq, minimum, maximum, freq = delta_aggregates(deltas)
+    if not count:
+        return
+    member_state["count"] += count
+    member_state["total"] += total
+    member_state["total_sq"] += total_sq
+    if member_state["min"] is None or minimum < member_state["min"]:
+        member_state["min"] = minimum
+    if member_state["max"] is None or maximum > member_state["max"]:
+        member_state["max"] = maximum
+    for delta, occurrences in freq.items():
+        key = str(delta)
+        member_state["freq"][key] = member_state["freq"].get(key, 0) + occurrences
+
+
+def update_analytics_state(state, rows):
+    """
+    Folds newly appended combinations into the state with one inverted-index
+    pass per filter, in O(len(rows) * filters + members * filters).
+    """
+    with stage("analytics", rows=len(rows)):
+        return _update_analytics_state(state, rows)
+
+
+def _update_analytics_state(state, rows):
+    masks = evaluate_filters(rows, state["filters_list"])
+    numbers = numbers_matrix(rows)
+    for filter_str, filter_state, mask in zip(
+        state["filters_list"], state["filters"], masks
+    ):
+        positions, matched = member_positions(rows, filter_str, mask, numbers)
+        offset = filter_state["matched"]
+        for key, member_state in filter_state["members"].items():
+            member_rows = positions.get(int(key))
+            if member_rows is None or not len(member_rows):
+                continue
+            dyn_index = np.asarray(member_rows, dtype=np.int64) + offset
+            if member_state["last"] is not None:
+                dyn_index = np.concatenate(([member_state["last"]], dyn_index))
+            _record_deltas(member_state, np.diff(dyn_index))
+            member_state["last"] = int(dyn_index[-1])
+        filter_state["matched"] += matched
+    state["row_count"] += len(rows)
+    return state
+
+
+def analytics_from_state(state):
+    """Renders the analytics output (same shape as refresh_analytics) from a state."""
+    results: dict[str, dict[str, Any]] = {}
+    for filter_index, (filter_str, filter_state) in enumerate(
+        zip(state["filters_list"], state["filters"])
+    ):
+        metric_key = "general" if filter_str == "all" else f"filter_{filter_index:02d}"
+        for key, member_state in filter_state["members"].items():
+            freq = {int(k): v for k, v in member_state["freq"].items()}
+            results.setdefault(key, {"key": key})[metric_key] = speed_summary(
+                filter_str,
+                member_state["count"],
+                member_state["total"],
+                member_state["total_sq"],
+                member_state["min"],
+                member_state["max"],
+                freq,
+            )
+    return list(results.values())
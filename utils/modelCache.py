@@ -0,0 +1,83 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def deep_sizeof(obj, _seen=None):
+    """Approximate memory footprint of nested dicts, lists, tuples and scalars."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def estimate_rows_size(rows, sample=64):
+    """Estimates the footprint of a list of similar rows from a sample of them."""
+    if not rows:
+        return sys.getsizeof(rows)
+    step = max(len(rows) // sample, 1)
+    sampled = rows[::step][:sample]
+    # objects shared between rows (dictionary-decoded strings) are counted once
+    seen = set()
+    per_row = sum(deep_sizeof(row, seen) for row in sampled) / len(sampled)
+    return int(sys.getsizeof(rows) + per_row * len(rows))
+
+
+class ModelCache:
+    """
+    Least-recently-used cache bounded by an estimated memory budget, safe to
+    share between request threads.
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_bytes, sizeof=estimate_rows_size):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """Stores a value; values larger than the whole budget are not cached."""
+        size = self._sizeof(value) if size is None else size
+        with self._lock:
+            self.pop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+            return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
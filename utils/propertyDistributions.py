@@ -0,0 +1,235 @@
+from collections import defaultdict
+from functools import lru_cache
+from itertools import combinations
+from math import comb
+from utils.combinBatchProperties import prime_table
+from utils.combinPropertiesFunctions import level_key, prime_count, sequence_key
+
+# Properties whose distribution over a full model is computed without enumeration.
+DISTRIBUTION_PROPERTIES = ("level_key", "sequence_key", "prime_count")
+
+# Per-row functions used by the brute-force reference.
+_ROW_FUNCTIONS = {
+    "level_key": lambda numbers, population_size: level_key(numbers, population_size),
+    "sequence_key": lambda numbers, population_size: sequence_key(numbers),
+    "prime_count": lambda numbers, population_size: prime_count(numbers),
+}
+
+
+def _validate(population, size, properties):
+    values = sorted(population)
+    if any(not isinstance(v, int) for v in values):
+        raise ValueError("Population members must be integers.")
+    if len(set(values)) != len(values):
+        raise ValueError("Population members must be distinct.")
+    if not isinstance(size, int) or not 0 < size <= len(values):
+        raise ValueError("size must be an integer between 1 and the population size.")
+    properties = DISTRIBUTION_PROPERTIES if properties is None else properties
+    if isinstance(properties, str):
+        properties = [properties]
+    unknown = [p for p in properties if p not in DISTRIBUTION_PROPERTIES]
+    if unknown:
+        raise ValueError(
+            f"Unknown properties: {unknown}. Available: {list(DISTRIBUTION_PROPERTIES)}."
+        )
+    return tuple(values), tuple(p for p in DISTRIBUTION_PROPERTIES if p in properties)
+
+
+def _member_traits(values):
+    """(level, is_prime) of every sorted member; level is None outside 1..n."""
+    population_size = len(values)
+    primes = prime_table(max(max(values), 1))
+    return [
+        (
+            (value - 1) // 10 if 1 <= value <= population_size else None,
+            value > 1 and bool(primes[value]),
+        )
+        for value in values
+    ]
+
+
+def _labels(levels, prime_total, runs):
+    return (
+        None if levels is None else "-".join(map(str, levels)),
+        None if runs is None else "-".join(map(str, runs)),
+        None if prime_total is None else str(prime_total),
+    )
+
+
+def _take_level(levels, level, times=1):
+    if levels is None or level is None:
+        return levels
+    levels = list(levels)
+    levels[level] += times
+    return tuple(levels)
+
+
+def _sequence_counts(values, size, track):
+    """Member-by-member dynamic programming, needed when sequence_key is tracked:
+    a taken member extends the last run only if the previous member was taken
+    and is one below it."""
+    traits = _member_traits(values)
+    population_size = len(values)
+    levels = (0,) * (population_size // 10 + 1) if "level_key" in track else None
+    prime_total = 0 if "prime_count" in track else None
+    states = {(levels, prime_total, (), False): 1}
+    for position, value in enumerate(values):
+        remaining = population_size - position - 1
+        follows = position > 0 and value == values[position - 1] + 1
+        level, is_prime = traits[position]
+        advanced = defaultdict(int)
+        for (levels, prime_total, runs, took_previous), count in states.items():
+            taken = sum(runs)
+            if size - taken <= remaining:
+                advanced[(levels, prime_total, runs, False)] += count
+            if taken < size:
+                if took_previous and follows:
+                    runs_taken = runs[:-1] + (runs[-1] + 1,)
+                else:
+                    runs_taken = runs + (1,)
+                key = (
+                    _take_level(levels, level),
+                    None if prime_total is None else prime_total + is_prime,
+                    runs_taken,
+                    True,
+                )
+                advanced[key] += count
+        states = advanced
+
+    result = defaultdict(int)
+    for (levels, prime_total, runs, _), count in states.items():
+        if sum(runs) == size:
+            result[_labels(levels, prime_total, runs)] += count
+    return result
+
+
+def _cell_counts(values, size, track):
+    """Products of binomials, when sequence_key is not tracked: members are
+    grouped into cells of equal (level, is_prime) and a combination taking t
+    of the m members of a cell is counted C(m, t) times."""
+    cells = defaultdict(int)
+    for level, is_prime in _member_traits(values):
+        cells[
+            (
+                level if "level_key" in track else None,
+                is_prime if "prime_count" in track else False,
+            )
+        ] += 1
+    levels = (0,) * (len(values) // 10 + 1) if "level_key" in track else None
+    prime_total = 0 if "prime_count" in track else None
+    states = {(levels, prime_total, 0): 1}
+    for (level, is_prime), members in cells.items():
+        advanced = defaultdict(int)
+        for (levels, prime_total, taken), count in states.items():
+            for times in range(min(members, size - taken) + 1):
+                key = (
+                    _take_level(levels, level, times),
+                    None if prime_total is None else prime_total + is_prime * times,
+                    taken + times,
+                )
+                advanced[key] += count * comb(members, times)
+        states = advanced
+
+    result = defaultdict(int)
+    for (levels, prime_total, taken), count in states.items():
+        if taken == size:
+            result[_labels(levels, prime_total, None)] += count
+    return result
+
+
+@lru_cache(maxsize=64)
+def joint_counts(values, size, track=DISTRIBUTION_PROPERTIES):
+    """
+    Number of combinations with each tuple of values of the tracked
+    properties, counted without enumerating the C(n,k) combinations. The number of
+    states depends on n and k only, so the cost is polynomial in n for a
+    given k instead of growing with C(n,k).
+    Args:
+        values (tuple[int]): The sorted, distinct population members.
+        size (int): k, the number of members in each combination.
+        track (tuple[str]): Properties to count jointly.
+    Returns:
+        dict[tuple, int]: (level_key, sequence_key, prime_count) -> count, with
+        None in place of untracked properties.
+    """
+    if "sequence_key" in track:
+        return dict(_sequence_counts(values, size, track))
+    return dict(_cell_counts(values, size, track))
+
+
+def _marginal(joint, positions):
+    counts = defaultdict(int)
+    for key, count in joint.items():
+        counts[tuple(key[p] for p in positions)] += count
+    return counts
+
+
+def _rows(names, counts, total):
+    return [
+        {**dict(zip(names, key)), "count": count, "probability": count / total}
+        for key, count in sorted(counts.items())
+    ]
+
+
+def _shape(counts, properties, total, pairs):
+    """Response tables from joint counts keyed by the tuple of properties they track."""
+    position = {name: DISTRIBUTION_PROPERTIES.index(name) for name in properties}
+    source = {
+        name: next(joint for group, joint in counts.items() if name in group)
+        for name in properties
+    }
+    result = {
+        "total": total,
+        "distributions": {
+            name: _rows((name,), _marginal(source[name], (position[name],)), total)
+            for name in properties
+        },
+    }
+    if pairs:
+        result["joint"] = {
+            f"{a}|{b}": _rows(
+                (a, b), _marginal(counts[(a, b)], (position[a], position[b])), total
+            )
+            for a, b in combinations(properties, 2)
+        }
+    return result
+
+
+def property_distributions(population, size, properties=None, pairs=True):
+    """
+    Distributions of level_key, sequence_key and prime_count over the full
+    model of a population, without generating it.
+    Args:
+        population (list[int]): The population from which combinations are built.
+        size (int): The size of each combination.
+        properties (list[str]): Subset of DISTRIBUTION_PROPERTIES; None selects all.
+        pairs (bool): Also return the joint distribution of every pair of properties.
+    Returns:
+        dict: "total" (C(n,k)), "distributions" (property -> rows of value, count
+        and probability) and, with pairs, "joint" ("a|b" -> rows of both values,
+        count and probability).
+    Raises:
+        ValueError: If the population, size or properties are invalid.
+    """
+    values, properties = _validate(population, size, properties)
+    total = comb(len(values), size)
+    # Each pair is counted on its own, which is far cheaper than the joint of all three.
+    groups = list(combinations(properties, 2)) if pairs else []
+    groups += [(name,) for name in properties if not any(name in g for g in groups)]
+    counts = {group: joint_counts(values, size, group) for group in groups}
+    return _shape(counts, properties, total, pairs)
+
+
+def enumerate_distributions(population, size, properties=None, pairs=True):
+    """Brute-force reference of property_distributions: enumerates every combination."""
+    values, properties = _validate(population, size, properties)
+    joint = defaultdict(int)
+    for numbers in combinations(values, size):
+        key = tuple(
+            _ROW_FUNCTIONS[name](list(numbers), len(values))[1]
+            for name in DISTRIBUTION_PROPERTIES
+        )
+        joint[key] += 1
+    groups = list(combinations(properties, 2)) + [(name,) for name in properties]
+    counts = {group: joint for group in groups}
+    return _shape(counts, properties, comb(len(values), size), pairs)
@@ -0,0 +1,121 @@
+from utils.combinBatchProperties import (
+    encode_gap_properties,
+    encode_level_key,
+    encode_prime_count,
+    encode_sequence_key,
+)
+from utils.combinPropertiesFunctions import (
+    arith_avg,
+    arith_std,
+    arith_total,
+    avg_gap,
+    gap_variance,
+    generate_boxes,
+    level_key,
+    level_members,
+    max_gap,
+    prime_count,
+    sequence_key,
+)
+
+# Context a property function may need besides the combination itself.
+CONTEXT_KEYS = ("population_size", "index")
+
+
+class PropertyDefinition:
+    """
+    A combination property: its output key, the per-combination function,
+    the extra context the function takes (positionally, after the numbers)
+    and, optionally, a batch implementation over an (N, k) array returning
+    dictionary-encoded (labels, codes). Properties computed together declare
+    a group encoder instead: it returns {name: (labels, codes)} for every
+    property of the group and is called once per batch. Properties without a
+    batch implementation are derived per row when the row is exported.
+    """
+
+    __slots__ = ("name", "function", "context", "encode", "group")
+
+    def __init__(self, name, function, context=(), encode=None, group=None):
+        unknown = set(context) - set(CONTEXT_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown property context: {sorted(unknown)}.")
+        self.name = name
+        self.function = function
+        self.context = tuple(context)
+        self.encode = encode
+        self.group = group
+
+    def compute(self, numbers, index=None, population_size=28):
+        """The property value of one combination."""
+        available = {"population_size": population_size, "index": index}
+        return self.function(numbers, *(available[c] for c in self.context))[1]
+
+
+# Registered properties, in the key order of exported rows.
+PROPERTY_REGISTRY = {}
+
+
+def register_property(name, function, context=(), encode=None, group=None):
+    """Registers (or replaces) a property and returns its definition."""
+    definition = PropertyDefinition(name, function, context, encode, group)
+    PROPERTY_REGISTRY[name] = definition
+    return definition
+
+
+def resolve_properties(names=None):
+    """
+    Validates a property selection and returns it in registry order.
+    Args:
+        names (Iterable[str] | None): Requested property names; None selects all.
+    Raises:
+        ValueError: If a name is not a registered property.
+    """
+    if names is None:
+        return tuple(PROPERTY_REGISTRY)
+    if isinstance(names, str):
+        names = [names]
+    unknown = [name for name in names if name not in PROPERTY_REGISTRY]
+    if unknown:
+        raise ValueError(
+            f"Unknown properties: {unknown}. Available: {list(PROPERTY_REGISTRY)}."
+        )
+    selected = set(names)
+    return tuple(name for name in PROPERTY_REGISTRY if name in selected)
+
+
+def definition_for(function):
+    """The registered definition of a property function, or None."""
+    for definition in PROPERTY_REGISTRY.values():
+        if definition.function is function:
+            return definition
+    return None
+
+
+register_property(
+    "level_key",
+    level_key,
+    context=("population_size",),
+    encode=lambda arr, population_size: encode_level_key(arr, population_size),
+)
+register_property("level_members", level_members, context=("population_size",))
+register_property(
+    "sequence_key",
+    sequence_key,
+    encode=lambda arr, population_size: encode_sequence_key(arr),
+)
+register_property(
+    "prime_count",
+    prime_count,
+    encode=lambda arr, population_size: encode_prime_count(arr),
+)
+register_property("boxes", generate_boxes, context=("index",))
+
+
+def _encode_gap_group(arr, population_size):
+    return encode_gap_properties(arr)
+
+
+# The gap and arithmetic properties share one pass of encode_gap_properties.
+for _function in (gap_variance, max_gap, avg_gap, arith_total, arith_avg, arith_std):
+    register_property(_function.__name__, _function, group=_encode_gap_group)
+del _function
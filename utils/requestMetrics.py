@@ -0,0 +1,152 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the request handled by the current thread/task, if any.
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+# tracemalloc slows every thread of the process, so "metrics": "memory" is only
+# honoured when REQUEST_TRACE_MEMORY is set; tracing then starts with the first
+# such request and stays on for the life of the process.
+TRACE_MEMORY = os.getenv("REQUEST_TRACE_MEMORY", "false").lower() == "true"
+_tracing_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """
+    Per-request stage timings. Every stage accumulates its wall time, number
+    of calls, rows and bytes. Stages may nest: a streamed upload generates,
+    enriches and serializes rows while blocks are being staged. With trace_memory
+    every stage also records the peak traced memory reached while it was open.
+    tracemalloc is process-wide: the peak is reset when a stage opens and
+    includes every request running meanwhile, so the figures are only exact
+    while the process serves one request at a time.
+    """
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._open = []
+        self._started = time.perf_counter()
+        self._elapsed = None
+
+    def _stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = {"ms": 0.0, "calls": 0, "rows": 0, "bytes": 0}
+        return self.stages[name]
+
+    def _fold_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for stage in self._open:
+            stage["peak_mib"] = max(stage.get("peak_mib", 0), round(peak / 2**20, 2))
+
+    def enter(self, name):
+        stage = self._stage(name)
+        if self.trace_memory:
+            self._fold_peak()
+            tracemalloc.reset_peak()
+        self._open.append(stage)
+        return stage
+
+    def exit(self, stage, elapsed):
+        if self.trace_memory:
+            self._fold_peak()
+        for position in range(len(self._open) - 1, -1, -1):
+            if self._open[position] is stage:
+                del self._open[position]
+                break
+        stage["ms"] += elapsed * 1000
+        stage["calls"] += 1
+
+    def add(self, name, rows=0, bytes=0, seconds=0.0):
+        stage = self._stage(name)
+        stage["rows"] += rows
+        stage["bytes"] += bytes
+        stage["ms"] += seconds * 1000
+
+    def finish(self):
+        """Closes the request and returns the metrics as a JSON-ready dict."""
+        if self._elapsed is None:
+            self._elapsed = time.perf_counter() - self._started
+        result = {
+            "request": self.name,
+            "total_ms": round(self._elapsed * 1000, 2),
+            "stages": {
+                name: {k: round(v, 2) if k == "ms" else v for k, v in stage.items()}
+                for name, stage in self.stages.items()
+            },
+        }
+        if resource is not None:
+            # ru_maxrss is reported in KiB on Linux.
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            result["peak_rss_mib"] = round(peak_rss / 1024, 2)
+        return result
+
+
+def current_metrics():
+    """Metrics of the request being handled, or None outside of a request."""
+    return _current.get()
+
+
+@contextmanager
+def track_request(name, trace_memory=False):
+    """
+    Collects stage metrics for the enclosed request handling and logs them.
+    trace_memory is ignored unless REQUEST_TRACE_MEMORY is set.
+    """
+    trace_memory = trace_memory and TRACE_MEMORY
+    if trace_memory and not tracemalloc.is_tracing():
+        with _tracing_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+    metrics = RequestMetrics(name, trace_memory)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        logger.info("request metrics %s", json.dumps(metrics.finish()))
+
+
+@contextmanager
+def stage(name, rows=0, bytes=0):
+    """Times the enclosed block as a stage of the current request (no-op outside one)."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    entry = metrics.enter(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.exit(entry, time.perf_counter() - started)
+        metrics.add(name, rows, bytes)
+
+
+def record(name, rows=0, bytes=0, seconds=0.0):
+    """Adds rows, bytes and time measured by the caller to a stage of the current request."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(name, rows, bytes, seconds)
+
+
+def server_timing(metrics):
+    """Server-Timing header value for a dict returned by RequestMetrics.finish."""
+    entries = [f'total;dur={metrics["total_ms"]}']
+    for name, stage in metrics["stages"].items():
+        entries.append(f"{name};dur={stage['ms']}")
+    return ", ".join(entries)
@@ -1,11 +1,52 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from utils import combinGenerator
-from utils import blobHandler
+from utils.combinPropertiesFunctions import normalize_windows
+from utils.filterCompiler import compile_filters
+from utils.propertyRegistry import resolve_properties
+from utils.requestMetrics import track_request
+from utils.shardedGenerator import normalize_workers
+
+# Functions that only generate combinations: CPU-bound, run in their own threads.
+# Every other function imports utils.blobHandler (and the storage SDK) on first use.
+GENERATION_FUNCTIONS = (
+    "generateAllPossibleCombinations",
+    "generateRandomCombinations",
+    "generateRandomUniqueCombinations",
+)
+
+# Concurrent blob-bound requests served by one instance (threads share the
+# pooled blob client) and concurrent generation requests. Generation stays in
+# this process so every request shares the full-model cache. Most of its work
+# holds the GIL (enumerating combinations, building arrays from Python tuples,
+# serializing JSON), so concurrent full models barely overlap and each one
+# adds its whole model to the peak memory; the pool is kept small.
+REQUEST_THREADS = int(os.getenv("REQUEST_THREADS", 8))
+GENERATION_THREADS = int(os.getenv("GENERATION_THREADS", 2))
+
+_request_executor = None
+_generation_executor = None
 
 
 def handle_request(data):
     """Receives http reques body to fill up parameters needed
     evaluates the function to call and returns the result.
+    Stage metrics are always logged; "metrics": true adds them to the response
+    as "_metrics" ("metrics": "memory" also reports peak memory per stage when
+    REQUEST_TRACE_MEMORY is set).
     """
+    metrics_mode = data.get("metrics")
+    with track_request(
+        data.get("functionName"), trace_memory=metrics_mode == "memory"
+    ) as metrics:
+        response = _handle_request(data)
+    if metrics_mode and isinstance(response, tuple) and isinstance(response[0], dict):
+        response[0]["_metrics"] = metrics.finish()
+    return response
+
+
+def _handle_request(data):
     func_name = data.get("functionName")
     sample = data.get("sample")
     size = data.get("combinationSize", data.get("size"))
@@ -18,12 +59,22 @@ def handle_request(data):
     else:
         key_members = []
     filters_list = data.get("filtersList", [])
+    binary_format = data.get("binaryFormat", False)
+    try:
+        # Sharded uploads spawn one process per worker, at most one per CPU.
+        workers = normalize_workers(data.get("workers"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    compress = data.get("compress")
+    properties = data.get("properties")
+    if properties is not None:
+        # Only the selected properties are computed and serialized.
+        try:
+            properties = list(resolve_properties(properties))
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-    if func_name in [
-        "generateAllPossibleCombinations",
-        "generateRandomCombinations",
-        "generateRandomUniqueCombinations",
-    ]:
+    if func_name in GENERATION_FUNCTIONS:
 
         if not all([func_name, sample, size]):
             return {"error": "Missing required parameters."}, 400
@@ -41,19 +92,44 @@ def handle_request(data):
 
         generator_func = getattr(combinGenerator, generator_func_name)
 
+        paginated = any(data.get(k) is not None for k in ("offset", "limit", "cursor"))
+        if generator_func_name == "generate_all_combinations" and paginated:
+            return _combination_page(data, sample, size, properties)
+
         # Call the generator function with appropriate arguments
         try:
             if generator_func_name == "generate_all_combinations":
-                combinations = generator_func(sample, size)
+                combinations = generator_func(sample, size, properties=properties)
             else:
-                combinations = generator_func(sample, size, amount)
+                combinations = generator_func(
+                    sample, size, amount, properties=properties
+                )
+        except ValueError as e:
+            return {"error": str(e)}, 400
         except Exception as e:
             return {"error generating combinations model": str(e)}, 500
 
         return {"combinations": combinations}, 200  # models
 
+    elif func_name == "PropertyDistributions":
+        if not all([sample, size]):
+            return {"error": "Missing required parameters."}, 400
+        try:
+            from utils.propertyDistributions import property_distributions
+
+            result = property_distributions(
+                sample, size, properties, pairs=data.get("pairs", True)
+            )
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error computing property distributions": str(e)}, 500
+        return result, 200
+
     elif func_name == "UploadModel":
         try:
+            from utils import blobHandler
+
             result = blobHandler.upload_model(
                 model_type=model_type,
                 model_name=model_name,
@@ -61,6 +137,10 @@ def handle_request(data):
                 size=size,
                 amount=amount,
                 data=provided_data,
+                binary_format=binary_format,
+                workers=workers,
+                compress=compress,
+                properties=properties,
             )
             return {"message": "Model uploaded successfully", "result": result}, 200
         except Exception as e:
@@ -68,6 +148,8 @@ def handle_request(data):
 
     elif func_name == "OverwriteModel":
         try:
+            from utils import blobHandler
+
             result = blobHandler.overwrite_model(
                 model_type=model_type,
                 model_name=model_name,
@@ -75,6 +157,10 @@ def handle_request(data):
                 size=size,
                 amount=amount,
                 data=provided_data,
+                binary_format=binary_format,
+                workers=workers,
+                compress=compress,
+                properties=properties,
             )
             return {"message": "Model overwritten successfully", "result": result}, 200
         except Exception as e:
@@ -82,12 +168,16 @@ def handle_request(data):
 
     elif func_name == "AddCombin":
         try:
+            from utils import blobHandler
+
             result = blobHandler.append_to_model(
                 model_name=model_name,
                 population=sample,
                 size=size,
                 amount=amount,
                 data=provided_data,
+                binary_format=binary_format,
+                properties=properties,
             )
             return {
                 "message": "Combination(s) added successfully",
@@ -96,12 +186,32 @@ def handle_request(data):
         except Exception as e:
             return {"error adding combination": str(e)}, 500
 
+    elif func_name == "CompactModel":
+        try:
+            from utils import blobHandler
+
+            result = blobHandler.compact_model(
+                model_name=model_name, binary_format=binary_format
+            )
+            return {"message": "Model compacted successfully", "result": result}, 200
+        except Exception as e:
+            return {"error compacting model": str(e)}, 500
+
     elif func_name == "RefreshActualsAnalytics":
+        windows = data.get("windows")
         try:
+            normalize_windows(windows)
+            compile_filters(filters_list)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        try:
+            from utils import blobHandler
+
             result = blobHandler.refresh_analytics_model(
                 model_name=model_name,
                 key_members=key_members,
                 filters_list=filters_list,
+                windows=windows,
             )
             return {
                 "message": "Actual analytics refreshed successfully",
@@ -110,5 +220,73 @@ def handle_request(data):
         except Exception as e:
             return {"error refreshing actual analytics": str(e)}, 500
 
+    elif func_name == "Batch":
+        from utils.batchHandler import handle_batch
+
+        return handle_batch(data, _handle_request)
+
     else:
         return {"error": "Invalid function name."}, 400
+
+
+def _combination_page(data, sample, size, properties=None):
+    """One page of generateAllPossibleCombinations, selected by offset/limit or cursor."""
+    try:
+        if data.get("cursor") is not None:
+            offset = combinGenerator.decode_cursor(data["cursor"], sample, size)
+        else:
+            offset = data.get("offset", 0)
+        limit = data.get("limit", combinGenerator.DEFAULT_PAGE_SIZE)
+        combinations, next_offset = combinGenerator.generate_combination_page(
+            sample, size, offset, limit, properties
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        return {"error generating combinations model": str(e)}, 500
+
+    next_cursor = None
+    if next_offset is not None:
+        next_cursor = combinGenerator.encode_cursor(sample, size, next_offset)
+    return {
+        "combinations": combinations,
+        "offset": offset,
+        "limit": limit,
+        "total": combinGenerator.combination_count(len(sample), size),
+        "nextCursor": next_cursor,
+    }, 200
+
+
+def request_executor():
+    """Thread pool running blob-bound requests, created on first use."""
+    global _request_executor
+    if _request_executor is None:
+        _request_executor = ThreadPoolExecutor(
+            max_workers=REQUEST_THREADS, thread_name_prefix="request"
+        )
+    return _request_executor
+
+
+def generation_executor():
+    """Thread pool running CPU-bound generation requests, created on first use;
+    kept apart from request_executor so generation never starves blob requests."""
+    global _generation_executor
+    if _generation_executor is None:
+        _generation_executor = ThreadPoolExecutor(
+            max_workers=GENERATION_THREADS, thread_name_prefix="generation"
+        )
+    return _generation_executor
+
+
+async def handle_request_async(data):
+    """Async counterpart of handle_request for the event loop of an async trigger.
+    Generation requests and every other request run on two separate thread
+    pools, so one instance serves concurrent uploads and analytics without
+    blocking the loop on blob I/O or CPU-heavy generation.
+    """
+    loop = asyncio.get_running_loop()
+    if data.get("functionName") in GENERATION_FUNCTIONS:
+        executor = generation_executor()
+    else:
+        executor = request_executor()
+    return await loop.run_in_executor(executor, handle_request, data)
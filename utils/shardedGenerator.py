@@ -0,0 +1,97 @@
+import os
+from utils.combinGenerator import DEFAULT_CHUNK_SIZE, iter_combination_models
+from utils.combinIndex import combination_count, iter_combination_range
+
+# Upper bound of rows per shard; more shards than workers keeps cores busy
+# when shards finish unevenly and bounds the memory of each worker.
+DEFAULT_SHARD_ROWS = 500_000
+
+
+def normalize_workers(workers):
+    """Validates a worker count and clamps it to the CPUs of the host.
+    Returns:
+        int | None: The worker count, or None when workers is None.
+    Raises:
+        ValueError: If workers is not a positive integer.
+    """
+    if workers is None:
+        return None
+    if isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+        raise ValueError("workers must be a positive integer.")
+    return min(workers, os.cpu_count() or 1)
+
+
+def plan_shards(population_size, size, workers=None, shard_rows=DEFAULT_SHARD_ROWS):
+    """Splits the C(n,k) rank space into contiguous shards.
+    Args:
+        population_size (int): n, the number of members in the population.
+        size (int): k, the number of members in each combination.
+        workers (int): Number of worker processes; at least this many shards are planned.
+        shard_rows (int): Upper bound of rows per shard.
+    Returns:
+        list[tuple[int, int]]: (start_rank, row_count) of every shard, in rank order.
+    """
+    total = combination_count(population_size, size)
+    if total == 0:
+        return []
+    workers = workers or os.cpu_count() or 1
+    shard_count = min(total, max(workers, -(-total // shard_rows)))
+    base, extra = divmod(total, shard_count)
+    shards = []
+    start = 0
+    for shard in range(shard_count):
+        rows = base + (1 if shard < extra else 0)
+        shards.append((start, rows))
+        start += rows
+    return shards
+
+
+def iter_shard_models(
+    population,
+    size,
+    start_rank,
+    row_count,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    properties=None,
+):
+    """Stream the enriched models of one shard in chunks.
+    The shard starts directly at start_rank through the combinadic index, and
+    the models carry their global index (start_rank + 1 onwards).
+    """
+    yield from iter_combination_models(
+        iter_combination_range(population, size, start_rank, row_count),
+        start_index=start_rank + 1,
+        population_size=len(population),
+        chunk_size=chunk_size,
+        properties=properties,
+    )
+
+
+def run_sharded(worker, population, size, workers=None, shard_rows=DEFAULT_SHARD_ROWS):
+    """Runs worker(shard_number, population, size, start_rank, row_count) for every
+    shard in a process pool and returns the results in shard order.
+    The worker must be a picklable module-level function. Workers are spawned,
+    not forked, so none of them inherits the parent's storage client and the
+    pooled connections it holds; each creates its own on first use.
+    Raises:
+        ValueError: If workers is not a positive integer.
+    """
+    workers = normalize_workers(workers) or os.cpu_count() or 1
+    shards = plan_shards(len(population), size, workers, shard_rows)
+    if workers <= 1 or len(shards) <= 1:
+        return [
+            worker(number, population, size, start, rows)
+            for number, (start, rows) in enumerate(shards)
+        ]
+    # imported here so that requests validating workers do not load multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("spawn")
+    ) as pool:
+        futures = [
+            pool.submit(worker, number, population, size, start, rows)
+            for number, (start, rows) in enumerate(shards)
+        ]
+        return [future.result() for future in futures]
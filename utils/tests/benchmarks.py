@@ -0,0 +1,315 @@
+"""
+Benchmark suite for generation, properties, analytics, serialization and the
+storage flows, run against an in-memory blob store (no Azure account needed).
+
+    python utils/tests/benchmarks.py                        # quick suite
+    python utils/tests/benchmarks.py --suite full           # adds 35C5 and 40C6
+    python utils/tests/benchmarks.py --only analytics       # cases matching a substring
+    python utils/tests/benchmarks.py --suite full --save utils/tests/benchmarkBaseline.json
+    python utils/tests/benchmarks.py --baseline other.json  # compare against another file
+    python utils/tests/benchmarks.py --no-baseline          # only print
+
+Every case reports the median and best wall time of its repeats and the peak
+traced memory of one extra run under tracemalloc. Results are compared against
+the committed baseline (benchmarkBaseline.json, next to this script): the
+script prints REGRESSION lines and exits with status 1 when a case got slower
+or allocates more than the baseline beyond the tolerances. Timings depend on
+the machine; refresh the baseline with --save when running elsewhere.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from itertools import combinations
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from utils import blobHandler, combinGenerator  # noqa: E402
+from utils.columnarModel import encode_model  # noqa: E402
+from utils.combinationStore import CombinationStore, json_default  # noqa: E402
+from utils.combinPropertiesFunctions import refresh_analytics  # noqa: E402
+from utils.propertyDistributions import (  # noqa: E402
+    joint_counts,
+    property_distributions,
+)
+from utils.propertyRegistry import PROPERTY_REGISTRY  # noqa: E402
+from utils.tests.memoryBlobStore import install_memory_store  # noqa: E402
+
+POPULATION_28 = list(range(1, 29))
+
+# Results every run is compared against unless --no-baseline is given.
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmarkBaseline.json"
+)
+
+# Filters typical of the Power BI analytics refresh.
+ANALYTICS_FILTERS = [
+    "all",
+    "level_key=2-2-1",
+    "level_key=2-1-2",
+    "level_key=1-2-2",
+    "level_key=2-2-1&sequence_key=1-1-1-1-1",
+    "prime_count=2",
+    "prime_count>=3",
+    "prime_count=1..2&level_key!=3-1-1",
+    "sequence_key in (2-1-1-1,1-2-1-1)",
+    "sequence_key=1-1-1-1-1|prime_count=0",
+    "level_key not in (5-0-0,0-5-0)",
+    "prime_count=2&sequence_key=1-1-1-1-1",
+]
+
+# name -> (suite, repeat, setup); setup prepares the inputs and returns the callable to time.
+CASES = {}
+
+
+def case(name, suite="quick", repeat=3):
+    def register(setup):
+        CASES[name] = (suite, repeat, setup)
+        return setup
+
+    return register
+
+
+def _fresh_full_model(population, size):
+    combinGenerator.full_model_cache.clear()
+    return combinGenerator.generate_all_combinations(population, size)
+
+
+@case("generate_all 28C5")
+def _generate_28c5():
+    return lambda: _fresh_full_model(POPULATION_28, 5)
+
+
+@case("generate_all 28C5 (cached)", repeat=5)
+def _generate_28c5_cached():
+    _fresh_full_model(POPULATION_28, 5)
+    return lambda: combinGenerator.generate_all_combinations(POPULATION_28, 5)
+
+
+@case("generate_all 35C5", suite="full", repeat=1)
+def _generate_35c5():
+    return lambda: _fresh_full_model(list(range(1, 36)), 5)
+
+
+@case("generate_all 40C6", suite="full", repeat=1)
+def _generate_40c6():
+    return lambda: len(_fresh_full_model(list(range(1, 41)), 6))
+
+
+@case("iter_all 40C6 (streamed)", suite="full", repeat=1)
+def _iter_40c6():
+    def run():
+        rows = 0
+        for chunk in combinGenerator.iter_all_combinations(list(range(1, 41)), 6):
+            rows += len(chunk)
+        return rows
+
+    return run
+
+
+@case("page 28C5 offset 90000 limit 5000", repeat=5)
+def _page_28c5():
+    def run():
+        combinGenerator.full_model_cache.clear()
+        return combinGenerator.generate_combination_page(POPULATION_28, 5, 90000)
+
+    return run
+
+
+def _property_case(name):
+    @case(f"property {name} 28C5")
+    def setup():
+        definition = PROPERTY_REGISTRY[name]
+        rows = list(combinations(POPULATION_28, 5))
+        return lambda: [
+            definition.compute(list(row), i, len(POPULATION_28))
+            for i, row in enumerate(rows, 1)
+        ]
+
+
+for _name in ("level_key", "level_members", "sequence_key", "prime_count", "boxes"):
+    _property_case(_name)
+
+
+@case("batch properties 28C5")
+def _batch_properties():
+    rows = list(combinations(POPULATION_28, 5))
+    return lambda: CombinationStore.from_combinations(
+        rows, population_size=len(POPULATION_28)
+    )
+
+
+@case("property distributions 28C5 (closed form)", repeat=5)
+def _distributions_28c5():
+    def run():
+        joint_counts.cache_clear()
+        return property_distributions(POPULATION_28, 5)
+
+    return run
+
+
+def _random_unique_case(fill):
+    @case(f"random_unique 28C5 fill {fill:.0%}", repeat=1)
+    def setup():
+        amount = int(combinGenerator.combination_count(28, 5) * fill)
+        return lambda: combinGenerator.generate_random_unique_combinations(
+            POPULATION_28, 5, amount
+        )
+
+
+_random_unique_case(0.5)
+_random_unique_case(0.9)
+
+
+def _actuals(rows):
+    random.seed(rows)
+    return combinGenerator.generate_random_combinations(POPULATION_28, 5, rows)
+
+
+@case("refresh_analytics 20k rows 12 filters")
+def _refresh_analytics():
+    rows = _actuals(20000)
+    members = [str(m) for m in POPULATION_28]
+    return lambda: refresh_analytics(rows, members, ANALYTICS_FILTERS)
+
+
+@case("json.dumps indent=2 28C5", repeat=1)
+def _json_dumps():
+    rows = _fresh_full_model(POPULATION_28, 5)
+    return lambda: json.dumps(rows, indent=2, default=json_default)
+
+
+@case("serialize_json_chunks 28C5", repeat=1)
+def _json_chunks():
+    rows = _fresh_full_model(POPULATION_28, 5)
+    return lambda: "".join(blobHandler.serialize_json_chunks([rows]))
+
+
+@case("columnar encode 28C5", repeat=1)
+def _columnar():
+    rows = _fresh_full_model(POPULATION_28, 5)
+    return lambda: encode_model(rows, POPULATION_28)
+
+
+@case("upload_model full 28C5 (memory store)", repeat=1)
+def _upload_full():
+    def run():
+        install_memory_store()
+        combinGenerator.full_model_cache.clear()
+        return blobHandler.upload_model(
+            "fullModels", "bench", None, POPULATION_28, 1, 5
+        )
+
+    return run
+
+
+@case("append 10x500 + refresh analytics (memory store)", repeat=1)
+def _append_and_refresh():
+    batches = [_actuals(500) for _ in range(10)]
+    members = [str(m) for m in POPULATION_28]
+
+    def run():
+        install_memory_store()
+        for batch in batches:
+            blobHandler.append_to_model("bench", data=batch)
+            blobHandler.refresh_analytics_model("bench", members, ANALYTICS_FILTERS)
+
+    return run
+
+
+def measure(name, repeat, setup):
+    """Median/best seconds over repeat runs and peak traced MiB of one more run."""
+    run = setup()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "median_s": round(statistics.median(times), 4),
+        "best_s": round(min(times), 4),
+        "peak_mib": round(peak / 2**20, 2),
+    }
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """
+    Messages for every case slower or larger than the baseline beyond the
+    tolerances; 5 ms and 0.5 MiB of slack keep near-zero cases from flagging noise.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["median_s"] > base["median_s"] * (1 + time_tolerance) + 0.005:
+            regressions.append(
+                f"{name}: {result['median_s']:.4f}s vs {base['median_s']:.4f}s"
+            )
+        if result["peak_mib"] > base["peak_mib"] * (1 + memory_tolerance) + 0.5:
+            regressions.append(
+                f"{name}: {result['peak_mib']:.2f} MiB vs {base['peak_mib']:.2f} MiB"
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--suite", choices=("quick", "full"), default="quick")
+    parser.add_argument("--only", help="run only the cases containing this text")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, help="compare against this JSON file"
+    )
+    parser.add_argument(
+        "--no-baseline",
+        dest="baseline",
+        action="store_const",
+        const=None,
+        help="print the results without comparing them",
+    )
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    results = {}
+    for name, (suite, repeat, setup) in CASES.items():
+        if suite == "full" and args.suite != "full":
+            continue
+        if args.only and args.only not in name:
+            continue
+        results[name] = result = measure(name, repeat, setup)
+        print(
+            f"{name:<50} {result['median_s']:>9.4f}s"
+            f" (best {result['best_s']:.4f}s) {result['peak_mib']:>9.2f} MiB peak"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    # A run that just refreshed the baseline has nothing to compare against.
+    if args.baseline and os.path.abspath(args.baseline) != os.path.abspath(
+        args.save or ""
+    ):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(
+            results, baseline, args.time_tolerance, args.memory_tolerance
+        )
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,55 @@
+"""
+Checks the closed-form property distributions against brute-force enumeration
+of every combination, for every size of small contiguous populations and for
+random populations with gaps and out-of-range members.
+
+    python utils/tests/distributionCheck.py            # n up to 14
+    python utils/tests/distributionCheck.py --max-n 18
+
+Exits with status 1 and prints the failing cases on any mismatch.
+"""
+
+import argparse
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from utils.propertyDistributions import (  # noqa: E402
+    enumerate_distributions,
+    property_distributions,
+)
+
+
+def cases(max_n, random_cases, seed):
+    for n in range(1, max_n + 1):
+        for size in range(1, n + 1):
+            yield list(range(1, n + 1)), size
+    rng = random.Random(seed)
+    for _ in range(random_cases):
+        population = rng.sample(range(-3, 3 * max_n), rng.randint(2, max_n))
+        yield population, rng.randint(1, len(population))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--max-n", type=int, default=14)
+    parser.add_argument("--random-cases", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = []
+    checked = 0
+    for population, size in cases(args.max_n, args.random_cases, args.seed):
+        checked += 1
+        if property_distributions(population, size) != enumerate_distributions(
+            population, size
+        ):
+            failures.append((population, size))
+    for population, size in failures:
+        print(f"MISMATCH: population={population} size={size}")
+    print(f"{checked - len(failures)}/{checked} cases match brute-force enumeration")
+    sys.exit(1 if failures else 0)
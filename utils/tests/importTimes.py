@@ -0,0 +1,117 @@
+"""
+Cold-start harness: measures, in fresh interpreters, how long the function
+modules take to import and to serve a first generate-only request.
+
+    python utils/tests/importTimes.py                     # print the timings
+    python utils/tests/importTimes.py --save base.json    # store a baseline
+    python utils/tests/importTimes.py --baseline base.json --tolerance 0.25
+
+With --baseline the script exits with status 1 when a scenario got slower
+than the baseline by more than the tolerance (a fraction of the baseline).
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Each scenario runs in a new interpreter and reports its own elapsed time.
+SCENARIOS = {
+    "import responseHandler": "import utils.responseHandler",
+    "import HttpTriggerAPI": "import HttpTriggerAPI",
+    "first generate request": (
+        "from utils.responseHandler import handle_request\n"
+        "handle_request({'functionName': 'generateRandomCombinations',"
+        " 'sample': list(range(1, 29)), 'size': 5, 'amount': 1})"
+    ),
+}
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+exec(compile({code!r}, "<scenario>", "exec"))
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed,
+                   "storage_sdk_loaded": "azure.storage.blob" in sys.modules}}))
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_scenario(code, env):
+    """Runs one scenario in a fresh interpreter and returns (report, importtime log)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(code=code)],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def heaviest_imports(importtime_log, top=5):
+    """Modules up to two levels deep with the largest cumulative import time, in ms."""
+    totals = []
+    for match in _IMPORTTIME.finditer(importtime_log):
+        if len(match[3]) <= 3:
+            totals.append((int(match[2]) / 1000, match[4]))
+    return sorted(totals, reverse=True)[:top]
+
+
+def measure(repeat, env):
+    """Median time of every scenario over repeat runs, plus its heaviest imports."""
+    results = {}
+    for name, code in SCENARIOS.items():
+        runs = [run_scenario(code, env) for _ in range(repeat)]
+        results[name] = {
+            "ms": round(statistics.median(r["seconds"] for r, _ in runs) * 1000, 1),
+            "storage_sdk_loaded": runs[-1][0]["storage_sdk_loaded"],
+            "heaviest_imports": heaviest_imports(runs[-1][1]),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Names of the scenarios slower than the baseline beyond the tolerance."""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline and result["ms"] > baseline[name]["ms"] * (1 + tolerance)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE="1")
+    results = measure(args.repeat, env)
+    for name, result in results.items():
+        print(
+            f"{name:<26} {result['ms']:>8.1f} ms"
+            f"   storage SDK loaded: {result['storage_sdk_loaded']}"
+        )
+        for ms, module in result["heaviest_imports"]:
+            print(f"    {ms:>8.1f} ms  {module}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for name in regressions:
+            print(f"REGRESSION: {name} is slower than the baseline.")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,175 @@
+"""
+In-memory stand-in for the azure.storage.blob container client, covering the
+calls utils.blobHandler makes. Install it with install_memory_store() to run
+storage flows (benchmarks, local experiments) without an Azure account.
+"""
+
+import itertools
+import threading
+from types import SimpleNamespace
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+from utils.blobSession import not_modified_error
+
+_etags = itertools.count(1)
+# Conditional writes check and store atomically, as the service does.
+_write_lock = threading.Lock()
+
+
+class _Download:
+    def __init__(self, blob):
+        self._data = blob["data"]
+        self.properties = SimpleNamespace(
+            etag=blob["etag"], metadata=dict(blob["metadata"])
+        )
+
+    def readall(self):
+        return self._data
+
+
+class MemoryBlobClient:
+    """
+    Blob client over a shared dict of name -> {data, etag, metadata,
+    content_settings, blocks}. blocks is the committed block list as
+    (block id, bytes), or None for blobs written in one upload_blob call.
+    """
+
+    def __init__(self, blobs, name, staged=None):
+        self._blobs = blobs
+        self.blob_name = name
+        # uncommitted blocks of every blob, shared by its clients like the service's
+        self._staged = (staged if staged is not None else {}).setdefault(name, {})
+
+    def _check(self, etag, match_condition):
+        current = self._blobs.get(self.blob_name)
+        if match_condition == MatchConditions.IfNotModified and (
+            current is None or current["etag"] != etag
+        ):
+            raise ResourceModifiedError("The condition specified was not met.")
+        if match_condition == MatchConditions.IfMissing and current is not None:
+            raise ResourceExistsError("The specified blob already exists.")
+        if match_condition == MatchConditions.IfModified and (
+            current is not None and current["etag"] == etag
+        ):
+            raise not_modified_error()
+
+    def _store(self, data, metadata, content_settings, blocks=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        elif hasattr(data, "read"):
+            data = data.read()
+        self._blobs[self.blob_name] = {
+            "data": bytes(data),
+            "etag": f'"0x{next(_etags):X}"',
+            "metadata": dict(metadata or {}),
+            "content_settings": content_settings,
+            "blocks": blocks,
+        }
+        self._staged.clear()
+
+    def upload_blob(
+        self,
+        data,
+        overwrite=False,
+        metadata=None,
+        content_settings=None,
+        etag=None,
+        match_condition=None,
+        **kwargs,
+    ):
+        if not overwrite and self.blob_name in self._blobs:
+            raise ResourceExistsError("The specified blob already exists.")
+        with _write_lock:
+            self._check(etag, match_condition)
+            self._store(data, metadata, content_settings)
+
+    def stage_block(self, block_id, data, **kwargs):
+        self._staged[block_id] = bytes(data)
+
+    def commit_block_list(
+        self,
+        block_list,
+        metadata=None,
+        content_settings=None,
+        etag=None,
+        match_condition=None,
+        **kwargs,
+    ):
+        from azure.storage.blob import BlockState
+
+        with _write_lock:
+            self._check(etag, match_condition)
+            current = self._blobs.get(self.blob_name)
+            committed = dict((current or {}).get("blocks") or [])
+            blocks = []
+            for block in block_list:
+                if block.state == BlockState.COMMITTED:
+                    source = committed
+                elif block.state == BlockState.UNCOMMITTED:
+                    source = self._staged
+                else:
+                    source = self._staged if block.id in self._staged else committed
+                blocks.append((block.id, source[block.id]))
+            data = b"".join(payload for _, payload in blocks)
+            self._store(data, metadata, content_settings, blocks)
+
+    def get_block_list(self, block_list_type="committed", **kwargs):
+        blocks = self._blob()["blocks"] or []
+        return [SimpleNamespace(id=i, size=len(payload)) for i, payload in blocks], []
+
+    def _blob(self):
+        if self.blob_name not in self._blobs:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        return self._blobs[self.blob_name]
+
+    def download_blob(self, etag=None, match_condition=None, **kwargs):
+        blob = self._blob()
+        self._check(etag, match_condition)
+        return _Download(blob)
+
+    def get_blob_properties(self, **kwargs):
+        blob = self._blob()
+        return SimpleNamespace(
+            name=self.blob_name,
+            etag=blob["etag"],
+            size=len(blob["data"]),
+            metadata=dict(blob["metadata"]),
+            content_settings=blob["content_settings"],
+        )
+
+    def exists(self, **kwargs):
+        return self.blob_name in self._blobs
+
+    def delete_blob(self, **kwargs):
+        self._blob()
+        del self._blobs[self.blob_name]
+
+
+class MemoryContainerClient:
+    """Container client keeping every blob in a dict."""
+
+    def __init__(self):
+        self.blobs = {}
+        self.staged = {}
+
+    def get_blob_client(self, blob):
+        return MemoryBlobClient(self.blobs, blob, self.staged)
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        return [
+            SimpleNamespace(name=name, size=len(blob["data"]))
+            for name, blob in sorted(self.blobs.items())
+            if name.startswith(name_starts_with or "")
+        ]
+
+
+def install_memory_store():
+    """Points utils.blobHandler at a fresh in-memory container and returns it."""
+    from utils import blobHandler
+
+    blobHandler.container_client = MemoryContainerClient()
+    return blobHandler.container_client